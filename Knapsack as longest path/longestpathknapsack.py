@@ -1,88 +1,390 @@
 from gurobipy import *
+from functools import lru_cache
+from multiprocessing import Pool
+import numpy as np
+import scipy.sparse as sp
 
 
-def solve(a, p, b): #a: size   p:profit   b:capacity 
-    nitems = len(p)
-    items = range(nitems)
+def solve(a, p, b, method=None, prune=True, verbose=True): #a: size   p:profit   b:capacity
+    # method "dp" sweeps the DAG directly, "mip" hands the flow model to
+    # gurobi. Without side constraints the longest path needs no MIP, so
+    # "dp" is the default. Both results have ObjVal, status, the selected
+    # arcs in path order in _arcs and the selected items in _items.
+    if method is None:
+        method = "dp"
 
-    # Do not change the following line!
-    vertices = [(c, i) for i in range(nitems+1) for c in range(b+2)]
-    # TODO: Generate arcs ----------------------------------------
+    if method == "dp":
+        return solve_dp(a, p, b, verbose=verbose)
+    if method == "mip":
+        return solve_mip(a, p, b, prune=prune, verbose=verbose)
+    raise ValueError("unknown method %r, use 'dp' or 'mip'" % method)
 
-    # KEY OF THIS PROBLEM => CAPACITY+1!!!!!!
-    arcs_horizon = [((c,i),(c+1,i),0) for i in range(nitems+1) for c in range(b+1)]
-    arcs_vertical = [((c,i),(c,i+1),0) for i in range(nitems) for c in range(b+2)]
-    a.insert(0,0)
-    p.insert(0,0)
-    arcs_profile = [((c,i),(c+a[i+1]+1,i+1),p[i+1]) for i in range(nitems) for c in range(b+1-(a[i+1]+1)+1)]
-    arcs = arcs_horizon + arcs_vertical + arcs_profile  # Use whatever format suits your needs
 
-    star_in, star_out = {},{}
+def solve_many(instances, workers=None, method=None, prune=True, chunksize=16):
+    # Solves an iterable of (a, p, b) instances on a pool of worker processes
+    # and yields one LongestPath per instance, in input order, as soon as it
+    # is done. With method="mip" and prune=False, instances with the same b
+    # and number of items share the horizontal/vertical arcs inside each
+    # worker (build_skeleton), so only the item arcs are built per instance.
+    # The default paths share nothing: solve_dp sweeps the columns without
+    # building arcs, and prune_arcs keeps a different subset of them for
+    # every instance.
+    jobs = ((a, p, b, method, prune) for a, p, b in instances)
+
+    if workers == 1:
+        for job in jobs:
+            yield solve_instance(job)
+        return
+
+    with Pool(workers) as pool:
+        for result in pool.imap(solve_instance, jobs, chunksize):
+            yield result
+
 
-    for arc in arcs:
-        if not arc[0] in star_out:
-            star_out[arc[0]] = []
-        star_out[arc[0]].append(arc[0:2])
+def solve_instance(job):
+    # Worker of solve_many. A gurobi model can not be sent back to the parent
+    # process, so MIP solutions are returned as LongestPath as well.
+    a, p, b, method, prune = job
+    result = solve(a, p, b, method=method, prune=prune, verbose=False)
+    if isinstance(result, LongestPath):
+        return result
+
+    if result.status != GRB.OPTIMAL:
+        return None
+    return LongestPath(result.ObjVal, result._arcs, result._items)
+
+
+def solve_mip(a, p, b, prune=True, verbose=True):
+    nitems = len(p)
 
-        if not arc[1] in star_in:
-            star_in[arc[1]] = []
-        star_in[arc[1]].append(arc[0:2])
-    # ------------------------------------------------------------------------
+    # Vertex (c,i) gets the integer id i*(b+2)+c, the arcs are kept as three
+    # parallel arrays tail/head/profit instead of lists of tuples
+    nvertices = (b+2)*(nitems+1)
+
+    # Drop dead and dominated vertices and arcs before building the model
+    if prune:
+        tail, head, profit, live, total = prune_arcs(a, p, b)
+        removed_vertices = nvertices - int(live.sum())
+        removed_arcs = total - len(tail)
+        if verbose:
+            print("Preprocessing removed %d of %d vertices and %d of %d arcs"
+              % (removed_vertices, nvertices, removed_arcs, total))
+    else:
+        tail, head, profit = build_arcs(a, p, b)
+        live = np.ones(nvertices, dtype=bool)
+    narcs = len(tail)
+
+    source = 0                      # (0,0)
+    sink = nitems*(b+2) + b+1       # (b+1,nitems)
 
     # Model
     model = Model("Flowbased knapsack")
     model.modelSense = GRB.MAXIMIZE
+    if not verbose:
+        model.Params.OutputFlag = 0
 
-    # Decision variable x_a indicates whether arc a is selected (value 1) or
+    # Decision variable x[k] indicates whether arc k is selected (value 1) or
     # not (value 0)
-    # TODO: Adjust string formatting (behind the "%" sign) so that the --------
-    # variables in the gurobi model will have the correct name! Also use
-    # reasonable dict keys for x[...] =
-    x = {}
-    for arc in arcs:
-        x[arc[0],arc[1]] = model.addVar(name="x_(%s,%s),(%s,%s)" % (arc[0][0],arc[0][1],arc[1][0],arc[1][1]), vtype=GRB.BINARY, obj=arc[2])
-    # -------------------------------------------------------------------------
-
-    # Update the model to make variables known.
-    # From now on, no variables should be added.
-    model.update()
-
-    # TODO: Add your constraints ----------------------------------------------
+    x = model.addMVar(narcs, vtype=GRB.BINARY, obj=profit, name="x")
 
-    # the forward star of the source is 1
-    model.addConstr(quicksum(x[arc[0],arc[1]] for arc in arcs if arc[0]==(0,0)) 
-                    - quicksum(x[arc[0],arc[1]] for arc in arcs if arc[1] == (0,0)) == 1)
+    # Flow conservation for every vertex in one go: out-star minus in-star is
+    # 1 at the source, -1 at the sink and 0 everywhere else. The rows of the
+    # node-arc incidence matrix are exactly the CSR adjacency arrays.
+    out_ptr, out_arcs = adjacency(nvertices, tail)
+    in_ptr, in_arcs = adjacency(nvertices, head)
+    ones = np.ones(narcs)
+    incidence = (sp.csr_matrix((ones, out_arcs, out_ptr), shape=(nvertices, narcs))
+                 - sp.csr_matrix((ones, in_arcs, in_ptr), shape=(nvertices, narcs)))
 
-    # the backward star of the senke is -1
-    model.addConstr(quicksum(x[arc[0],arc[1]] for arc in arcs if arc[0]==(b+1,nitems)) 
-                    - quicksum(x[arc[0],arc[1]] for arc in arcs if arc[1] == (b+1,nitems)) == -1)
-
-    model.addConstrs(quicksum(x[arc[0], arc[1]] for arc in star_out[vertex])
-                     == quicksum(x[arc[0], arc[1]] for arc in star_in[vertex]) for vertex in vertices if not (vertex == (0,0) or vertex==(b+1,nitems)))
-    # -------------------------------------------------------------------------
+    rhs = np.zeros(nvertices)
+    rhs[source] = 1
+    rhs[sink] = -1
+    model.addConstr(incidence[live] @ x == rhs[live], name="flow")
 
     model.update()
     # For debugging: print your model
     # model.write('model.lp')
     model.optimize()
 
-    # TODO: Adjust your dict keys for x[...] to print out the selected --------
-    # edges from your solution and then uncomment those lines.
-    # This is not not necessary for grading but helps you confirm that your
-    # model works
-
-    # Printing solution and objective value
-    def printSolution():
-        if model.status == GRB.OPTIMAL:
-            print('\n objective: %g\n' % model.ObjVal)
-            print("Selected following arcs:")
-            for arc in arcs:
-                if x[arc[0],arc[1]].x == 1:
-                    print(arc)
-        else:
-            print("No solution!")
-    # -------------------------------------------------------------------------
-
-    printSolution()
+    if model.status == GRB.OPTIMAL:
+        # a path only moves right and down, so sorting the tails by
+        # column and row gives the path order
+        model._arcs = sorted((arc_tuple(tail[k], head[k], profit[k], b)
+                              for k in np.flatnonzero(x.X > 0.5)),
+                             key=lambda arc: (arc[0][1], arc[0][0]))
+        model._items = [arc[1][1] for arc in model._arcs if arc[0][0] != arc[1][0] and arc[0][1] != arc[1][1]]
+    if verbose:
+        print_solution(model)
+    if prune:
+        model._removed_vertices = removed_vertices
+        model._removed_arcs = removed_arcs
     # Please do not delete the following line
     return model
+
+
+def build_arcs(a, p, b):
+    # Arcs of the (b+2) x (nitems+1) grid on integer vertex ids, in the order
+    # horizontal, vertical, item arcs.
+    # KEY OF THIS PROBLEM => CAPACITY+1!!!!!!
+    skeleton_tail, skeleton_head = build_skeleton(b, len(p))
+    item_tail, item_head, item_profit = build_item_arcs(a, p, b)
+
+    tail = np.concatenate([skeleton_tail, item_tail])
+    head = np.concatenate([skeleton_head, item_head])
+    profit = np.concatenate([np.zeros(len(skeleton_tail)), item_profit])
+    return tail, head, profit
+
+
+@lru_cache(maxsize=8)
+def build_skeleton(b, nitems):
+    # Horizontal and vertical arcs, they only depend on b and the number of
+    # items and are shared by all instances of that shape that build_arcs
+    # builds (the unpruned MIP). The arrays are cached, so they are made
+    # read-only.
+    width = b + 2
+
+    # horizontal (c,i)->(c+1,i) for c in 0..b
+    columns = np.arange(nitems+1) * width
+    horizon = (columns[:, None] + np.arange(b+1)).ravel()
+
+    # vertical (c,i)->(c,i+1)
+    vertical = np.arange(nitems*width)
+
+    tail = np.concatenate([horizon, vertical])
+    head = np.concatenate([horizon + 1, vertical + width])
+    tail.flags.writeable = False
+    head.flags.writeable = False
+    return tail, head
+
+
+def build_item_arcs(a, p, b):
+    # Item arcs, the only part of the graph that depends on a and p
+    nitems = len(p)
+    width = b + 2
+
+    # item (c,i)->(c+a[i]+1,i+1) with profit p[i], as long as c+a[i]+1 <= b+1
+    item_tail, item_head, item_profit = [], [], []
+    for i in range(nitems):
+        step = a[i] + 1
+        if step > b+1:
+            continue
+        t = i*width + np.arange(width-step)
+        item_tail.append(t)
+        item_head.append(t + width + step)
+        item_profit.append(np.full(len(t), p[i]))
+
+    none = np.zeros(0, dtype=np.int64)
+    return (np.concatenate([none] + item_tail), np.concatenate([none] + item_head),
+            np.concatenate([np.zeros(0)] + item_profit))
+
+
+def prune_arcs(a, p, b):
+    # Same arcs as build_arcs, but only the ones that survive preprocessing,
+    # so the full grid is never materialized. Returns tail, head, profit, the
+    # mask of vertices still in use and the number of arcs before pruning.
+    #
+    # 1. Horizontal arcs before the last column are dominated: moving the
+    #    slack of a path to the last column keeps every item arc feasible and
+    #    the profit unchanged. Without them vertex (c,i) is reachable exactly
+    #    if c is a subset sum of the first i (shifted) item sizes.
+    # 2. Backward reachability removes vertices that cannot reach the sink.
+    # 3. An arc u->v is dropped if the longest path to u plus its profit plus
+    #    the fractional knapsack bound from v to the sink stays below the
+    #    greedy solution.
+    nitems = len(p)
+    width = b + 2
+    steps = [a[i] + 1 for i in range(nitems)]
+    sizes = np.array(steps, dtype=float)
+    profits = np.array(p, dtype=float)
+    narcs = (nitems+1)*(b+1) + nitems*width + sum(width-s for s in steps if s < width)
+
+    # backward sweep, every vertex of the last column reaches the sink through
+    # the horizontal arcs; stored packed, one bit per vertex
+    alive = np.ones(width, dtype=bool)
+    backward = [np.packbits(alive)]
+    for i in range(nitems-1, -1, -1):
+        nxt = alive
+        alive = nxt.copy()
+        if steps[i] < width:
+            alive[:width-steps[i]] |= nxt[steps[i]:]
+        backward.append(np.packbits(alive))
+    backward.reverse()
+
+    lower = greedy_bound(a, p, b) - 1e-6
+    capacity = b + 1 - np.arange(width)
+
+    # forward sweep with the subset-sum bitset of column i and the longest
+    # path to each of its vertices
+    reach = np.zeros(width, dtype=bool)
+    reach[0] = True
+    longest = np.where(reach, 0.0, -np.inf)
+    vertical_tail, item_tail, item_head, item_profit = [], [], [], []
+    for i in range(nitems):
+        step = steps[i]
+        live = reach & np.unpackbits(backward[i], count=width).astype(bool)
+        alive_next = np.unpackbits(backward[i+1], count=width).astype(bool)
+        bound = fractional_bound(sizes[i+1:], profits[i+1:], capacity)
+
+        # vertical arcs
+        vertical = live & alive_next & (longest + bound >= lower)
+        vertical_tail.append(i*width + np.flatnonzero(vertical))
+        reach_next = vertical.copy()
+        longest_next = np.where(vertical, longest, -np.inf)
+
+        # item arcs
+        if step < width:
+            with_item = longest[:width-step] + p[i]
+            item = (live[:width-step] & alive_next[step:]
+                    & (with_item + bound[step:] >= lower))
+            t = i*width + np.flatnonzero(item)
+            item_tail.append(t)
+            item_head.append(t + width + step)
+            item_profit.append(np.full(len(t), p[i]))
+            reach_next[step:] |= item
+            longest_next[step:] = np.maximum(longest_next[step:],
+                                             np.where(item, with_item, -np.inf))
+
+        reach, longest = reach_next, longest_next
+
+    # horizontal arcs of the last column lead to the sink without profit
+    longest = np.maximum.accumulate(longest)
+    horizon = nitems*width + np.flatnonzero(longest[:b+1] >= lower)
+
+    tail = np.concatenate([horizon] + vertical_tail + item_tail)
+    head = np.concatenate([horizon + 1] + [t + width for t in vertical_tail] + item_head)
+    profit = np.concatenate([np.zeros(len(tail) - sum(len(t) for t in item_tail))]
+                            + item_profit)
+
+    # a vertex survives if a kept arc still touches it
+    live = np.zeros(width*(nitems+1), dtype=bool)
+    live[tail] = True
+    live[head] = True
+    live[0] = live[nitems*width + b+1] = True
+    return tail, head, profit, live, narcs
+
+
+def greedy_bound(a, p, b):
+    # Profit of the greedy path: items by decreasing profit per (shifted)
+    # size while they fit, or the best single item if that is better
+    room = b + 1
+    total = 0
+    best_single = 0
+    for i in sorted(range(len(p)), key=lambda i: -p[i] / (a[i]+1)):
+        if a[i] + 1 <= b + 1:
+            best_single = max(best_single, p[i])
+        if a[i] + 1 <= room:
+            room -= a[i] + 1
+            total += p[i]
+    return max(total, best_single)
+
+
+def fractional_bound(sizes, profits, capacity):
+    # Fractional knapsack bound for every remaining capacity in the array
+    # capacity, using the items given by sizes and profits
+    positive = profits > 0
+    sizes, profits = sizes[positive], profits[positive]
+    order = np.argsort(-profits / sizes, kind="stable")
+    sizes, profits = sizes[order], profits[order]
+
+    weight = np.concatenate([[0], np.cumsum(sizes)])
+    value = np.concatenate([[0], np.cumsum(profits)])
+    ratio = np.concatenate([profits / sizes, [0]])
+
+    k = np.searchsorted(weight, capacity, side="right") - 1
+    return value[k] + (capacity - weight[k]) * ratio[k]
+
+
+def adjacency(nvertices, ends):
+    # CSR-style star: the arcs with ends[k] == v are arcs[ptr[v]:ptr[v+1]]
+    arcs = np.argsort(ends, kind="stable")
+    ptr = np.zeros(nvertices+1, dtype=np.int64)
+    np.cumsum(np.bincount(ends, minlength=nvertices), out=ptr[1:])
+    return ptr, arcs
+
+
+def arc_tuple(tail, head, profit, b):
+    # ((c,i),(c',i'),profit) as in the original arc lists
+    tail, head = int(tail), int(head)
+    return ((tail % (b+2), tail // (b+2)), (head % (b+2), head // (b+2)), int(profit))
+
+
+def print_solution(result):
+    # Printing solution and objective value of solve_mip and solve_dp
+    if result.status == GRB.OPTIMAL:
+        print('\n objective: %g\n' % result.ObjVal)
+        print("Selected following arcs:")
+        for arc in result._arcs:
+            print(arc)
+    else:
+        print("No solution!")
+
+
+class LongestPath:
+    # Result of solve_dp, mimics the parts of the gurobi model of solve_mip
+    # that are used after solving: ObjVal, status, _arcs and _items.
+    def __init__(self, ObjVal, arcs, items):
+        self.ObjVal = ObjVal
+        self.status = GRB.OPTIMAL
+        self._arcs = arcs    # selected arcs ((c,i),(c',i'),profit) in path order
+        self._items = items  # selected items, 1-based like the vertex columns
+
+
+def solve_dp(a, p, b, verbose=True):
+    # Same graph as solve_mip: vertex (c,i) for c in 0..b+1, i in 0..nitems,
+    # horizontal arcs (c,i)->(c+1,i), vertical arcs (c,i)->(c,i+1) and item
+    # arcs (c,i-1)->(c+a[i]+1,i) with profit p[i]. Column i only depends on
+    # column i-1, so one sweep over the columns gives the longest path from
+    # (0,0) to every vertex.
+    nitems = len(p)
+    width = b + 2
+
+    # longest path values of the current column; in column 0 every vertex is
+    # reached by horizontal arcs only
+    value = np.zeros(width, dtype=np.asarray(list(p) + [0]).dtype)
+
+    # for backtracking we keep two bits per vertex: whether the best entry into
+    # (c,i) from column i-1 uses the item arc, and whether that entry is at
+    # least as good as arriving by the horizontal arc from (c-1,i)
+    took_item = []
+    entered = []
+
+    for i in range(1, nitems+1):
+        step = a[i-1] + 1
+        # vertical arcs
+        best = value.copy()
+        take = np.zeros(width, dtype=bool)
+        # item arcs
+        if step < width:
+            with_item = value[:width-step] + p[i-1]
+            take[step:] = with_item > best[step:]
+            best[step:] = np.where(take[step:], with_item, best[step:])
+        # horizontal arcs
+        value = np.maximum.accumulate(best)
+
+        took_item.append(np.packbits(take))
+        entered.append(np.packbits(best == value))
+
+    # walk back from the sink (b+1,nitems)
+    arcs, items = [], []
+    c = b + 1
+    for i in range(nitems, 0, -1):
+        mask = np.unpackbits(entered[i-1], count=width)[:c+1]
+        start = int(np.flatnonzero(mask)[-1])
+        arcs.extend(((cc-1, i), (cc, i), 0) for cc in range(c, start, -1))
+        c = start
+
+        if np.unpackbits(took_item[i-1], count=width)[c]:
+            step = a[i-1] + 1
+            arcs.append(((c-step, i-1), (c, i), p[i-1]))
+            items.append(i)
+            c -= step
+        else:
+            arcs.append(((c, i-1), (c, i), 0))
+    arcs.extend(((cc-1, 0), (cc, 0), 0) for cc in range(c, 0, -1))
+    arcs.reverse()
+    items.reverse()
+
+    result = LongestPath(value[b+1].item(), arcs, items)
+    if verbose:
+        print_solution(result)
+    return result
@@ -0,0 +1,57 @@
+import argparse
+import multiprocessing
+import resource
+import time
+
+import pd
+
+
+# Compares the two ways to solve the MaxMean objective: the linearized model
+# with u, w and r (method None) and Dinkelbach's method, which ends with the
+# exact model of pd.add_size_indicators. Every run happens in a fresh
+# process, so the peak memory of one run is not hidden by the other.
+def run(database_path, json_path, method, queue):
+    start = time.time()
+    model = pd.solve(database_path, json_path, 'MaxMean', method=method)
+    wall_time = time.time() - start
+
+    if method == 'dinkelbach':
+        objective = model._objective
+        bound = model._bound
+        iterations = len(model._iterations)
+        simplex_iterations = sum(it[4] for it in model._iterations)
+    else:
+        objective = model.ObjVal
+        bound = model.ObjBound
+        iterations = 1
+        simplex_iterations = model.IterCount
+
+    # ru_maxrss is in kilobytes on Linux
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((method or 'linearization', objective, bound, iterations, simplex_iterations,
+               model.NumVars, model.NumConstrs, wall_time, peak_memory))
+
+
+def benchmark(database_path, json_path):
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for method in [None, 'dinkelbach']:
+        queue = context.Queue()
+        process = context.Process(target=run, args=(database_path, json_path, method, queue))
+        process.start()
+        results.append(queue.get())
+        process.join()
+
+    print('\n%-14s %12s %12s %6s %10s %8s %8s %10s %12s'
+          % ('method', 'objective', 'bound', 'solves', 'simplex', 'vars', 'rows', 'time [s]', 'memory [MB]'))
+    for result in results:
+        print('%-14s %12.4f %12.4f %6d %10d %8d %8d %10.2f %12.1f' % result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the MaxMean linearization against Dinkelbach')
+    parser.add_argument('--database', default='./pd.db')
+    parser.add_argument('--json', default='./image2vec.json')
+    args = parser.parse_args()
+    benchmark(args.database, args.json)
@@ -1,144 +1,188 @@
 from gurobipy import *
-import pandas as pd
+from multiprocessing import Pool
+from scipy.spatial.distance import pdist, squareform
+import numpy as np
+import hashlib
+import json
+import os
 import sqlite3
-
-def solve(database_path, json_path, objective):
+import time
+
+def solve(database_path, json_path, objective, method=None, verbose=False, workers=None,
+          time_limit=1.0, warm_start=True):
+    # method None builds the full model for the objective, started from the
+    # heuristic solution if warm_start. For 'MaxMean', method 'dinkelbach'
+    # starts from the Dinkelbach fixed point of MaxSumSum-style models and
+    # then solves the ratio objective exactly with size indicators instead of
+    # the linearization with u, w and r. method 'lagrangian'
+    # decomposes by shop and solves the shops in parallel on workers
+    # processes. method 'heuristic' only runs the greedy/local search
+    # heuristic for time_limit seconds.
 
     # READ DATA
-    image_vec = pd.read_json(json_path)
+    data = read_database(database_path, verbose=verbose)
+    distance = pair_distances(data['styles'], json_path)
+
+    if method == 'dinkelbach':
+        if objective != 'MaxMean':
+            raise ValueError("method 'dinkelbach' is only for the MaxMean objective")
+        return solve_dinkelbach(data, distance)
+    if method == 'lagrangian':
+        return solve_lagrangian(data, distance, objective, workers=workers)
+    if method == 'heuristic':
+        model = solve_heuristic(data, distance, objective, time_limit=time_limit)
+        if model is None:
+            print('No Solution!')
+        else:
+            print('\n objective: %g\n' % model._objective)
+            for s in model._selection:
+                print(s, model._selection[s])
+        return model
+    if method is not None:
+        raise ValueError("unknown method %r" % method)
+
+    shops, styles = data['shops'], data['styles']
+    model, x, z, y, u, w, r = build_model(data, distance, objective)
+
+    if warm_start:
+        solution = solve_heuristic(data, distance, objective, time_limit=time_limit)
+        if solution is not None:
+            set_start(data, solution, x, z, y, u, w, r)
 
-    conn = sqlite3.connect(database_path)
-    cursor = conn.cursor()
-    sql = "select name from sqlite_master where type='table'"
-    cursor.execute(sql)
-    database = {}
-    for table in cursor.fetchall():
-        df = pd.read_sql_query("select * from "+ table[0], conn)
-        database[table[0]] = {}
-        for column in df.columns:
-            database[table[0]][column] = list(df[column])
-    conn.close()
+    model.update()
+    model.optimize()
+
+    if model.status == GRB.OPTIMAL:
+        print('\n objective: %g\n' % model.ObjVal)
 
-    for i in database:
-        for j in database[i]:
-            print(i, j, database[i][j])
+        for s in shops:
+            for i in styles:
+                print(x[(s,i)], u.get((s,i), ''))
 
-    # category_style{category_id=1} = [3,4,,8,9,10 style_id]
-    category_style = {}  
-    for i in database['categories']['id']:
-        category_style[i] = []
-        for j in range(len(database['style_categories']['category_id'])):
-            if database['style_categories']['category_id'][j] == i:
-                category_style[i].append(database['style_categories']['style_id'][j])
+        for s in r:
+            print(r[s])
+
+        for i in styles:
+            for j in styles:
+                if i >= j: # make sure i < j 
+                    continue
+                for s in shops:
+                    if (s,(i,j)) in w:
+                        print(w[(s,(i,j))])
+
+    else:
+        print('No Solution!')
+
+    return model
+
+def build_model(data, distance, objective, env=None):
+    # The assortment model for the objective 'MaxSumSum' or 'MaxMean'. The
+    # variables u, w and r of the mean linearization are only created for
+    # 'MaxMean', the dicts stay empty otherwise.
+    shops, styles = data['shops'], data['styles']
 
     # CREATE MODEL
-    model = Model('product diversity')
+    model = Model('product diversity', env=env)
 
     # Variables 
     x = {}
     z = {}
-    for i in database['styles']['id']:
-        for s in database['shops']['id']:
-            x[(s,i)] = model.addVar(name="x_%s_%s" % (s,i), vtype = 'N', lb=database['styles']['min_shipment'][i-1])
+    for i in styles:
+        for s in shops:
+            x[(s,i)] = model.addVar(name="x_%s_%s" % (s,i), vtype = 'N', lb=data['min_shipment'][i])
             z[(s,i)] = model.addVar(name="z_%s_%s" % (s,i), vtype = 'B')
 
     y = {}
-    for i in database['styles']['id']:
-        for j in database['styles']['id']:
+    for i in styles:
+        for j in styles:
             if i >= j: # make sure i < j 
                 continue
-            for s in database['shops']['id']:
+            for s in shops:
                 y[(s,(i,j))] = model.addVar(name="y_%s_(%s_%s)" % (s,i,j), vtype = 'B')
 
     # auxiliary variable to linearize the mean calculation
     u = {}
-    for i in database['styles']['id']:
-        for s in database['shops']['id']:
-            u[(s,i)] = model.addVar(name="u_%s_%s" % (s,i), vtype = 'C', lb=0)#, ub=1)
-
     w = {}
-    for i in database['styles']['id']:
-        for j in database['styles']['id']:
-            if i >= j: # make sure i < j 
-                continue
-            for s in database['shops']['id']:
-                w[(s,(i,j))] = model.addVar(name="w_%s_(%s_%s)" % (s,i,j), vtype = 'C', lb=0)#, ub=1)
-
     # reciprocal of the number of different styles distributed to store s
     r = {}
-    for s in database['shops']['id']:
-        r[s] = model.addVar(name='r_%s' % s, vtype = 'C', lb=0, ub=1)#lb=1/database['styles']['id'][-1], ub=1/2)
+    if objective == 'MaxMean':
+        for i in styles:
+            for s in shops:
+                u[(s,i)] = model.addVar(name="u_%s_%s" % (s,i), vtype = 'C', lb=0)#, ub=1)
+
+        for i in styles:
+            for j in styles:
+                if i >= j: # make sure i < j 
+                    continue
+                for s in shops:
+                    w[(s,(i,j))] = model.addVar(name="w_%s_(%s_%s)" % (s,i,j), vtype = 'C', lb=0)#, ub=1)
+
+        for s in shops:
+            r[s] = model.addVar(name='r_%s' % s, vtype = 'C', lb=0, ub=1)#lb=1/styles[-1], ub=1/2)
 
     # Objective function 
     model.modelSense = GRB.MAXIMIZE
 
     if objective == 'MaxSumSum':
-        model.setObjective(quicksum(y[(s,(i,j))]*euclidean(image_vec[i],image_vec[j]) 
-                                    for s in database['shops']['id']
-                                    for i in database['styles']['id']
-                                    for j in database['styles']['id']
-                                    if i < j))
+        model.setObjective(quicksum(y[(s,pair)]*distance[pair]
+                                    for s in shops
+                                    for pair in distance))
 
     if objective == 'MaxMean':
-        model.setObjective(quicksum(w[(s,(i,j))]*euclidean(image_vec[i],image_vec[j]) 
-                                    for s in database['shops']['id']
-                                    for i in database['styles']['id']
-                                    for j in database['styles']['id']
-                                    if i < j))
+        model.setObjective(quicksum(w[(s,pair)]*distance[pair]
+                                    for s in shops
+                                    for pair in distance))
 
     #Constraints 
 
     # there should not be to much or to little of each color at each store
-    for color_id in database['colors']['id']:
-        min_percentage = database['colors']['min_percentage'][color_id-1]
-        max_percentage = database['colors']['max_percentage'][color_id-1]
+    for color_id, (min_percentage, max_percentage) in data['colors'].items():
+        color_styles = data['color_styles'].get(color_id, [])
 
-        for s in database['shops']['id']:
-            model.addConstr(quicksum(x[(s,i)] for i in database['styles']['id'] if database['styles']['color_id'][i-1] == color_id) >=
-                            min_percentage*quicksum(x[(s,i)] for i in database['styles']['id']))
+        for s in shops:
+            model.addConstr(quicksum(x[(s,i)] for i in color_styles) >=
+                            min_percentage*quicksum(x[(s,i)] for i in styles))
 
-            model.addConstr(quicksum(x[(s,i)] for i in database['styles']['id'] if database['styles']['color_id'][i-1] == color_id) <=
-                            max_percentage*quicksum(x[(s,i)] for i in database['styles']['id']))
+            model.addConstr(quicksum(x[(s,i)] for i in color_styles) <=
+                            max_percentage*quicksum(x[(s,i)] for i in styles))
 
     # each store specifies how many units of each category they need at least and at most
-    for j in range(len(database['shop_categories']['shop_id'])):
-        shop_id = database['shop_categories']['shop_id'][j]
-        category_id = database['shop_categories']['category_id'][j]
-        min_delivery = database['shop_categories']['min_delivery'][j]
-        max_delivery = database['shop_categories']['max_delivery'][j]
+    for shop_id in shops:
+        for category_id, min_delivery, max_delivery in data['shop_categories'].get(shop_id, []):
+            category_styles = data['category_styles'].get(category_id, [])
 
-        model.addConstr(quicksum(x[(shop_id,i)] for i in category_style[category_id]) >= min_delivery)
-        model.addConstr(quicksum(x[(shop_id,i)] for i in category_style[category_id]) <= max_delivery)
+            model.addConstr(quicksum(x[(shop_id,i)] for i in category_styles) >= min_delivery)
+            model.addConstr(quicksum(x[(shop_id,i)] for i in category_styles) <= max_delivery)
 
     # there is only a limited supply of each style available
-    for i in database['styles']['id']:
-        max_shipment = database['styles']['supply'][i-1]
-        model.addConstr(quicksum(x[(s,i)] for s in database['shops']['id']) <= max_shipment)            
-    
+    for i in styles:
+        max_shipment = data['supply'][i]
+        model.addConstr(quicksum(x[(s,i)] for s in shops) <= max_shipment)
+
     # Linking x and z[s,i], z[s,i] and y[s,i,j] 
-    for s in database['shops']['id']:
-        for i in database['styles']['id']:
+    for s in shops:
+        for i in styles:
             model.addConstr(x[(s,i)] >= z[(s,i)])
-            for j in database['styles']['id']:
+            for j in styles:
                 if i >= j: # make sure i < j 
                     continue
                 model.addConstr(z[(s,i)] >= y[(s,(i,j))])
                 model.addConstr(z[(s,j)] >= y[(s,(i,j))])
     
     # linearize the mean calculation 
-    for s in database['shops']['id']:
-        model.addConstr(quicksum(z[(s,i)] for i in database['styles']['id']) >= 2)
-        #model.addConstr(r[s]*quicksum(z[(s,i)] for i in database['styles']['id']) == 1)
+    for s in shops:
+        model.addConstr(quicksum(z[(s,i)] for i in styles) >= 2)
+        #model.addConstr(r[s]*quicksum(z[(s,i)] for i in styles) == 1)
         if objective == 'MaxSumSum':
             continue 
 
         # the following is about MaxMean 
-        model.addConstr(quicksum(u[(s,i)] for i in database['styles']['id']) == 1) 
-        for i in database['styles']['id']:
+        model.addConstr(quicksum(u[(s,i)] for i in styles) == 1) 
+        for i in styles:
             model.addConstr(u[(s,i)] >= r[s] + z[(s,i)] - 1)
             model.addConstr(u[(s,i)] <= r[s])
             model.addConstr(u[(s,i)] <= z[(s,i)])
-            for j in database['styles']['id']:
+            for j in styles:
                 if i >= j:
                     continue
                 model.addConstr(w[(s,(i,j))] >= r[s] + z[(s,i)] + z[(s,j)] - 2)
@@ -146,40 +190,482 @@ def solve(database_path, json_path, objective):
                 model.addConstr(w[(s,(i,j))] <= z[(s,i)])
                 model.addConstr(w[(s,(i,j))] <= z[(s,j)])
 
-    model.update()
+    return model, x, z, y, u, w, r
+
+def solve_dinkelbach(data, distance, tolerance=1e-4, max_iterations=50, verbose=True):
+    # Dinkelbach's method for MaxMean, the sum over the shops of
+    # N_s / D_s with N_s = sum of d_ij y_sij and D_s = sum of z_si. With the
+    # current ratios lambda_s the parametric problem
+    #     max sum_s N_s - lambda_s D_s
+    # is the MaxSumSum model with objective -lambda_s on z_si. Its optimum is
+    # 0 exactly when no assortment has better ratios, otherwise lambda_s is
+    # updated to the ratios of the new solution. The same model is reused in
+    # every iteration and started from the previous solution.
+    # With one shop this is the exact ratio optimum: every assortment has
+    # N/D <= lambda + F/D <= lambda + max(0, F)/2 for the bound F of the last
+    # parametric problem, as D >= 2. With several shops coupled by the supply
+    # the fixed point is only a heuristic solution. It is then the start of
+    # the exact model of add_size_indicators on the same variables, whose
+    # ObjBound is model._bound. model._objective is the final objective.
+    shops, styles = data['shops'], data['styles']
+    model, x, z, y = build_model(data, distance, 'MaxSumSum')[:4]
+    model.Params.OutputFlag = 0
+
+    ratio = {s: 0 for s in shops}
+    model._iterations = []
+    for iteration in range(1, max_iterations+1):
+        for s in shops:
+            for i in styles:
+                z[(s,i)].Obj = -ratio[s]
+        model.optimize()
+
+        if model.status != GRB.OPTIMAL:
+            print('No Solution!')
+            return model
+
+        bound = sum(ratio.values()) + max(0, model.ObjBound) / 2
+        numerator = {s: sum(distance[pair]*y[(s,pair)].X for pair in distance) for s in shops}
+        denominator = {s: sum(z[(s,i)].X for i in styles) for s in shops}
+        parametric = model.ObjVal
+        ratio = {s: numerator[s] / denominator[s] for s in shops}
+        mean = sum(ratio.values())
+
+        model._iterations.append((iteration, mean, parametric, model.Runtime, model.IterCount))
+        if verbose:
+            print('iteration %d: mean objective %g, parametric objective %g' % (iteration, mean, parametric))
+
+        if parametric <= tolerance * max(1, mean):
+            break
+
+        # warm start the next parametric problem from this solution
+        variables = model.getVars()
+        model.setAttr('Start', variables, model.getAttr('X', variables))
+
+    if len(shops) > 1 or bound - mean > tolerance * max(1, mean):
+        variables = model.getVars()
+        model.setAttr('Start', variables, model.getAttr('X', variables))
+        v, g = add_size_indicators(data, distance, model, z, y)
+        for (s,k) in v:
+            v[(s,k)].Start = 1 if k == round(denominator[s]) else 0
+            g[(s,k)].Start = numerator[s] if k == round(denominator[s]) else 0
+        model.optimize()
+        if model.SolCount == 0:
+            print('No Solution!')
+            return model
+        mean, bound = model.ObjVal, model.ObjBound
+        model._iterations.append((len(model._iterations) + 1, mean, None, model.Runtime, model.IterCount))
+        if verbose:
+            print('exact model: mean objective %g, bound %g' % (mean, bound))
+
+    model._objective = mean
+    model._bound = bound
+    model._gap = (bound - mean) / max(abs(bound), 1e-9)
+    if not verbose:
+        return model
+    print('\n objective: %g, bound: %g, gap: %.2f%%\n' % (mean, bound, 100*model._gap))
+
+    for s in shops:
+        for i in styles:
+            print(x[(s,i)], z[(s,i)])
+
+    return model
+
+def add_size_indicators(data, distance, model, z, y):
+    # Makes the MaxSumSum model of solve_dinkelbach an exact MaxMean model.
+    # v[s,k] = 1 if shop s has k styles, and N_s is split into g[s,k] with
+    # g[s,k] <= M_k v[s,k], where M_k is the sum of the k(k-1)/2 largest
+    # distances. Only the g of the size of the shop is nonzero, so
+    #     N_s / D_s = sum_k g[s,k] / k
+    # is linear.
+    shops, styles = data['shops'], data['styles']
+    sizes = range(2, len(styles)+1)
+    largest = np.cumsum(sorted(distance.values(), reverse=True))
+    v = {}
+    g = {}
+    for s in shops:
+        numerator = quicksum(distance[pair]*y[(s,pair)] for pair in distance)
+        for k in sizes:
+            v[(s,k)] = model.addVar(name='v_%s_%s' % (s,k), vtype = 'B')
+            g[(s,k)] = model.addVar(name='g_%s_%s' % (s,k), vtype = 'C', lb=0)
+            model.addConstr(g[(s,k)] <= largest[k*(k-1)//2 - 1]*v[(s,k)])
+        model.addConstr(quicksum(v[(s,k)] for k in sizes) == 1)
+        model.addConstr(quicksum(z[(s,i)] for i in styles) == quicksum(k*v[(s,k)] for k in sizes))
+        model.addConstr(quicksum(g[(s,k)] for k in sizes) == numerator)
+    model.setObjective(quicksum(g[(s,k)] / k for s in shops for k in sizes), GRB.MAXIMIZE)
+    return v, g
+
+def solve_heuristic(data, distance, objective, time_limit=1.0):
+    # Greedy seeding and swap local search on the assortments (see
+    # heuristic_selection), then assign_quantities for the quantities.
+    # Returns the quantity model with the objective in model._objective, or
+    # None if no feasible quantities were found.
+    selection = heuristic_selection(data, distance, objective, time_limit)
+    model = assign_quantities(data, selection, distance)
+    if model is None:
+        return None
+    model._objective = selection_value(model._selection, distance, objective)
+    return model
+
+def heuristic_selection(data, distance, objective, time_limit=1.0):
+    # Assortments {shop: [styles]} for the objective. Every shop is seeded with
+    # the farthest pair and grown greedily by the style with the best gain
+    # (max dispersion), then improved by add, drop and swap moves until no
+    # move helps or time_limit seconds are used. A style may only be selected
+    # by as many shops as its supply covers with the minimum shipment. The
+    # color and category rows are left to assign_quantities.
+    start = time.time()
+    shops, styles = data['shops'], data['styles']
+    n = len(styles)
+    index = {i: k for k, i in enumerate(styles)}
+    matrix = np.zeros((n, n))
+    for (i,j), d in distance.items():
+        matrix[index[i], index[j]] = matrix[index[j], index[i]] = d
+
+    def value(total, size):
+        return total / size if objective == 'MaxMean' else total
+
+    # number of shops that can still get each style
+    capacity = np.array([data['supply'][i] // max(data['min_shipment'][i], 1) for i in styles])
+
+    selection = {}
+    for s in shops:
+        free = capacity > 0
+        if free.sum() < 2:
+            free[:] = True
+        masked = np.where(np.outer(free, free), matrix, -1)
+        first, second = np.unravel_index(np.argmax(masked), masked.shape)
+        chosen = np.zeros(n, dtype=bool)
+        chosen[[first, second]] = True
+        to_set = matrix[first] + matrix[second]   # distance of each style to the assortment
+        total = matrix[first, second]
+
+        # greedy growth
+        while True:
+            gain = np.where(~chosen & free, to_set, -np.inf)
+            k = int(np.argmax(gain))
+            size = chosen.sum()
+            if gain[k] == -np.inf or value(total + gain[k], size + 1) <= value(total, size):
+                break
+            chosen[k] = True
+            total += gain[k]
+            to_set += matrix[k]
+
+        # local search: best improving add, drop or swap
+        while time.time() - start < time_limit:
+            size = chosen.sum()
+            current = value(total, size)
+            best, move = current + 1e-9, None
+
+            outside = np.flatnonzero(~chosen & free)
+            inside = np.flatnonzero(chosen)
+            for k in outside:
+                if value(total + to_set[k], size + 1) > best:
+                    best, move = value(total + to_set[k], size + 1), (None, k)
+            if size > 2:
+                for k in inside:
+                    if value(total - to_set[k], size - 1) > best:
+                        best, move = value(total - to_set[k], size - 1), (k, None)
+            if len(outside):
+                for k in inside:
+                    swapped = total - to_set[k] + to_set[outside] - matrix[k, outside]
+                    m = int(np.argmax(swapped))
+                    if value(swapped[m], size) > best:
+                        best, move = value(swapped[m], size), (k, outside[m])
+
+            if move is None:
+                break
+            drop, add = move
+            if drop is not None:
+                chosen[drop] = False
+                to_set -= matrix[drop]
+                total -= to_set[drop]
+            if add is not None:
+                total += to_set[add]
+                chosen[add] = True
+                to_set += matrix[add]
+
+        capacity[chosen] -= 1
+        selection[s] = [styles[k] for k in np.flatnonzero(chosen)]
+
+    return selection
+
+def set_start(data, solution, x, z, y, u, w, r):
+    # Writes the quantities and assortments of a solve_heuristic model as MIP
+    # start into the variables of build_model
+    for s in data['shops']:
+        selected = set(solution._selection[s])
+        size = len(selected)
+        if s in r:
+            r[s].Start = 1 / size
+        for i in data['styles']:
+            x[(s,i)].Start = round(solution._x[(s,i)].X)
+            z[(s,i)].Start = 1 if i in selected else 0
+            if (s,i) in u:
+                u[(s,i)].Start = 1 / size if i in selected else 0
+    for (s,(i,j)) in y:
+        both = i in solution._selection[s] and j in solution._selection[s]
+        y[(s,(i,j))].Start = 1 if both else 0
+        if (s,(i,j)) in w:
+            w[(s,(i,j))].Start = 1 / len(solution._selection[s]) if both else 0
+
+def solve_lagrangian(data, distance, objective, workers=None, tolerance=1e-4, max_iterations=50):
+    # Lagrangian decomposition over the shops. The shops only share the
+    # supply rows sum_s x[s,i] <= supply[i]; with multipliers mu_i >= 0 on
+    # them the problem splits into one model per shop with objective
+    #     f_s - sum_i mu_i x[s,i]
+    # that are solved in parallel. Their sum plus sum_i mu_i supply[i] is an
+    # upper bound. A primal solution is recovered from the assortments of the
+    # shops with assign_quantities, and the multipliers follow a subgradient
+    # step of Polyak type.
+    shops, styles = data['shops'], data['styles']
+    multipliers = {i: 0.0 for i in styles}
+    bound, best, best_model = float('inf'), -float('inf'), None
+    theta, stalled = 2.0, 0
+
+    # the catalog and the distances go to every worker once, a task only
+    # carries the shop and the multipliers
+    pool = Pool(workers, initializer=init_shop_worker, initargs=(data, distance, objective))
+    try:
+        for iteration in range(1, max_iterations+1):
+            results = pool.map(solve_shop, [(s, multipliers) for s in shops])
+            if any(result is None for result in results):
+                print('No Solution!')
+                return best_model
+
+            value = sum(result[0] for result in results) + sum(multipliers[i]*data['supply'][i] for i in styles)
+            if value < bound - 1e-9:
+                bound, stalled = value, 0
+            else:
+                stalled += 1
+                if stalled >= 3:
+                    theta, stalled = theta / 2, 0
+
+            # primal solution with the assortments of this iteration
+            selection = {s: result[2] for s, result in zip(shops, results)}
+            model = assign_quantities(data, selection, distance)
+            if model is not None:
+                primal = selection_value(model._selection, distance, objective)
+                if primal > best:
+                    best, best_model = primal, model
+
+            gap = (bound - best) / max(abs(bound), 1e-9)
+            print('iteration %d: bound %g, best solution %g, gap %.2f%%' % (iteration, bound, best, 100*gap))
+            if gap <= tolerance or theta < 1e-3:
+                break
+
+            # subgradient of the dual function, the supply slack
+            subgradient = {i: data['supply'][i] - sum(result[1][i] for result in results) for i in styles}
+            norm = sum(g*g for g in subgradient.values())
+            if norm == 0:
+                break
+            target = best if best > -float('inf') else 0.95 * value
+            step = theta * (value - target) / norm
+            multipliers = {i: max(0.0, multipliers[i] - step*subgradient[i]) for i in styles}
+    finally:
+        pool.close()
+        pool.join()
+
+    if best_model is None:
+        print('No Solution!')
+        return None
+
+    best_model._objective = best
+    best_model._bound = bound
+    best_model._gap = gap
+    print('\n objective: %g, bound: %g, gap: %.2f%%\n' % (best, bound, 100*gap))
+    return best_model
+
+# Data of a worker of solve_lagrangian, set once by init_shop_worker. The
+# shop models are built on first use and then kept, later iterations only
+# change the multipliers in the objective.
+shop_worker = {}
+
+def init_shop_worker(data, distance, objective):
+    shop_worker['data'] = data
+    shop_worker['distance'] = distance
+    shop_worker['objective'] = objective
+    shop_worker['env'] = Env(params={'OutputFlag': 0})
+    shop_worker['models'] = {}
+
+def solve_shop(job):
+    # Lagrangian subproblem of one shop, runs in a worker of solve_lagrangian.
+    # Returns the bound on the objective value (the MIP gap leaves ObjVal
+    # below the optimum, the dual bound needs ObjBound), {style: x} and the
+    # selected styles.
+    shop, multipliers = job
+    data = shop_worker['data']
+    if shop not in shop_worker['models']:
+        # MaxMean gets the size indicators of solve_dinkelbach, they are
+        # smaller and faster to solve than the linearization with u, w and r
+        single = shop_data(data, shop)
+        model, x, z, y = build_model(single, shop_worker['distance'], 'MaxSumSum', env=shop_worker['env'])[:4]
+        if shop_worker['objective'] == 'MaxMean':
+            add_size_indicators(single, shop_worker['distance'], model, z, y)
+        model.Params.Threads = 1
+        shop_worker['models'][shop] = model, x, z
+    model, x, z = shop_worker['models'][shop]
+    for i in data['styles']:
+        x[(shop,i)].Obj = -multipliers[i]
     model.optimize()
 
-    if model.status == GRB.OPTIMAL:
-        print('\n objective: %g\n' % model.ObjVal)
+    if model.status != GRB.OPTIMAL:
+        return None
+    return (model.ObjBound,
+            {i: x[(shop,i)].X for i in data['styles']},
+            [i for i in data['styles'] if z[(shop,i)].X > 0.5])
+
+def shop_data(data, shop):
+    # The data of a single shop, the catalog is shared
+    single = dict(data)
+    single['shops'] = [shop]
+    single['shop_categories'] = {shop: data['shop_categories'].get(shop, [])}
+    return single
+
+def assign_quantities(data, selection, distance):
+    # Quantities for the assortments selection = {shop: [styles]}: a model over
+    # x and z only, with the color, category and supply rows. Styles outside
+    # the selection are not selected (z = 0) but may still be shipped. If not
+    # every selected style can be delivered, the selected styles are kept by
+    # weight, the sum of their distances to the rest of the assortment.
+    # Returns the solved model with the final assortments in model._selection,
+    # or None if no two styles per shop can be delivered.
+    shops, styles = data['shops'], data['styles']
+    model = Model('product diversity quantities')
+    model.Params.OutputFlag = 0
+    model.modelSense = GRB.MAXIMIZE
 
-        for s in database['shops']['id']:
-            for i in database['styles']['id']:
-                print(x[(s,i)], u[(s,i)])
+    x = {}
+    z = {}
+    for s in shops:
+        selected = set(selection[s])
+        for i in styles:
+            weight = sum(distance[min(i,j), max(i,j)] for j in selected if j != i)
+            x[(s,i)] = model.addVar(name="x_%s_%s" % (s,i), vtype = 'N', lb=data['min_shipment'][i])
+            z[(s,i)] = model.addVar(name="z_%s_%s" % (s,i), vtype = 'B', obj=weight,
+                                    ub=1 if i in selected else 0)
+            model.addConstr(x[(s,i)] >= z[(s,i)])
+        model.addConstr(quicksum(z[(s,i)] for i in styles) >= 2)
 
-        for s in database['shops']['id']:
-            print(r[s])
+    for color_id, (min_percentage, max_percentage) in data['colors'].items():
+        color_styles = data['color_styles'].get(color_id, [])
+        for s in shops:
+            model.addConstr(quicksum(x[(s,i)] for i in color_styles) >=
+                            min_percentage*quicksum(x[(s,i)] for i in styles))
+            model.addConstr(quicksum(x[(s,i)] for i in color_styles) <=
+                            max_percentage*quicksum(x[(s,i)] for i in styles))
 
-        for i in database['styles']['id']:
-            for j in database['styles']['id']:
-                if i >= j: # make sure i < j 
-                    continue
-                for s in database['shops']['id']:
-                    print(w[(s,(i,j))])
+    for shop_id in shops:
+        for category_id, min_delivery, max_delivery in data['shop_categories'].get(shop_id, []):
+            category_styles = data['category_styles'].get(category_id, [])
+            model.addConstr(quicksum(x[(shop_id,i)] for i in category_styles) >= min_delivery)
+            model.addConstr(quicksum(x[(shop_id,i)] for i in category_styles) <= max_delivery)
 
-    else:
-        print('No Solution!')
+    for i in styles:
+        model.addConstr(quicksum(x[(s,i)] for s in shops) <= data['supply'][i])
 
+    model.optimize()
+    if model.status != GRB.OPTIMAL:
+        return None
+    model._x = x
+    model._z = z
+    model._selection = {s: [i for i in styles if z[(s,i)].X > 0.5] for s in shops}
     return model
 
-def euclidean(vec1, vec2):
-    distance = 0
-
-    for i in range(len(vec1.index)):
-        distance += (vec1[i] - vec2[i]) ** 2
-    
-    distance = distance ** 0.5
+def selection_value(selection, distance, objective):
+    # Objective value of the assortments selection = {shop: [styles]}
+    value = 0
+    for styles in selection.values():
+        styles = sorted(styles)
+        total = sum(distance[(i,j)] for k, i in enumerate(styles) for j in styles[k+1:])
+        value += total / len(styles) if objective == 'MaxMean' else total
+    return value
+
+def read_database(database_path, verbose=False):
+    # Loads the columns the model needs, one query per table, and builds the
+    # lookups by id with GROUP BY. Everything is keyed by the ids from the
+    # database, so they do not have to be contiguous.
+    #
+    # shops, styles:            lists of ids
+    # min_shipment, supply:     {style: value}
+    # color:                    {style: color}
+    # colors:                   {color: (min_percentage, max_percentage)}
+    # color_styles:             {color: [styles]}
+    # category_styles:          {category: [styles]}
+    # shop_categories:          {shop: [(category, min_delivery, max_delivery)]}
+    conn = sqlite3.connect(database_path)
+    cursor = conn.cursor()
+    data = {}
+
+    data['shops'] = [row[0] for row in cursor.execute("select id from shops order by id")]
+
+    data['styles'], data['min_shipment'], data['supply'], data['color'] = [], {}, {}, {}
+    for style, min_shipment, supply, color in cursor.execute(
+            "select id, min_shipment, supply, color_id from styles order by id"):
+        data['styles'].append(style)
+        data['min_shipment'][style] = min_shipment
+        data['supply'][style] = supply
+        data['color'][style] = color
+
+    data['colors'] = {color: (min_percentage, max_percentage) for color, min_percentage, max_percentage
+                      in cursor.execute("select id, min_percentage, max_percentage from colors order by id")}
+
+    data['color_styles'] = group_ids(cursor.execute(
+        "select color_id, group_concat(id) from styles group by color_id"))
+    data['category_styles'] = group_ids(cursor.execute(
+        "select category_id, group_concat(style_id) from style_categories group by category_id"))
+
+    data['shop_categories'] = {}
+    for shop, category, min_delivery, max_delivery in cursor.execute(
+            "select shop_id, category_id, min_delivery, max_delivery from shop_categories"):
+        data['shop_categories'].setdefault(shop, []).append((category, min_delivery, max_delivery))
+    conn.close()
 
-    return distance 
+    if verbose:
+        for key in data:
+            print(key, data[key])
+
+    return data
+
+def group_ids(rows):
+    # {key: [ids]} from rows (key, 'id,id,...') of a group_concat query
+    return {key: [int(i) for i in ids.split(',')] for key, ids in rows}
+
+def pair_distances(styles, json_path):
+    # {(i,j): distance} for every pair of style ids i < j
+    style_ids, distances = distance_matrix(json_path)
+    style_index = {style: k for k, style in enumerate(style_ids)}
+    return {(i,j): distances[style_index[i], style_index[j]]
+            for i in styles
+            for j in styles
+            if i < j}
+
+def distance_matrix(json_path, cache=True):
+    # Euclidean distances between all style vectors of the image2vec json.
+    # Returns the style ids in file order and the matrix indexed by position
+    # in that list. The matrix is cached next to the json as .npy, keyed by
+    # the hash and modification time of the json file.
+    with open(json_path, 'rb') as f:
+        raw = f.read()
+    vectors = json.loads(raw)
+    style_ids = [int(i) for i in vectors]
+
+    cache_path = None
+    if cache:
+        digest = hashlib.sha1(raw).hexdigest()[:16]
+        mtime = os.stat(json_path).st_mtime_ns
+        cache_path = '%s.%s.%d.npy' % (os.path.splitext(json_path)[0], digest, mtime)
+        if os.path.exists(cache_path):
+            distances = np.load(cache_path)
+            if distances.shape == (len(style_ids), len(style_ids)):
+                return style_ids, distances
+
+    points = np.array([vectors[i] for i in vectors], dtype=float)
+    distances = squareform(pdist(points, 'euclidean'))
+
+    if cache_path is not None:
+        np.save(cache_path, distances)
+
+    return style_ids, distances
 
 if __name__ == "__main__":
     solve('./pd.db', './image2vec.json', 'MaxMean')
\ No newline at end of file
@@ -1,7 +1,16 @@
 #!/usr/bin/env python3
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from gurobipy import *
 import networkx as nx
+import numpy as np
+import bisect
+import hashlib
+import json
 import math
+import os
+import time
 
 
 # This function can stay unchanged
@@ -36,287 +45,785 @@ def prepare_output(cities, G, x, y):
     return G
 
 
-# Lots of work to do in this function!
-def solve(full_instance_path):
+def solve(full_instance_path, method=None, warm_start=True, time_limit=10, coarse_resolution=None, graph=False):
     """Solving function, takes an instance file, constructs the time-expanded network, builds and solves a gurobi model and returns the solution.
 
     Args:
         full_instance_path (string): Path to the instance file to read in
+        method (string): None for the full model, "benders" for the Benders decomposition of solve_benders, "slope_scaling" for the heuristic of solve_slope_scaling alone, "refinement" for the dynamic discretization discovery of solve_refinement
+        warm_start (bool): Start the full model from the slope scaling solution
+        time_limit (float): Time budget of the slope scaling heuristic in seconds
+        coarse_resolution (float): Spacing in hours of the initial time points of the "refinement" method (solve_refinement), which solves on partially time-expanded networks instead of the full one
+        graph (bool): Also build the networkx graph G for prepare_output, the solve itself only works on the compiled network
 
     Returns:
         model: Gurobi model after solving
         cities (dict): Maps city names to their location in the 2D plane, e.g., {"cityname": (10,5)}
-        G (nx.DiGraph): Graph of the time-expanded network with additional edge and node information
+        G (nx.DiGraph): Graph of the time-expanded network (the last partial one for "refinement") with additional edge and node information, None unless graph
         x (dict): Dictionary of gurobi variables for the commodity flow in the form {(commodity, arc): variable}. Arc is an element of G.edges and commodity is an element of cities
         y (dict): Dictionary of gurobi variables for the plane flow {arc: variable}
     """
 
-    # Read in the instance data
-    # ???, ???, ... = read_instance(full_instance_path)  # --- TODO ---
-    data = read_instance(full_instance_path)
-    cities = {}  # --- TODO
-    hubs = []
-    terminals = []
-    key_cities = return_key(dict_=data, value_='CITIES')
-    key_demand = return_key(dict_=data, value_='DEMAND')
-
-    for i in range(key_cities+1, key_demand):
-        cities[data[i][0]] = (int(data[i][1]), int(data[i][2]))
-        if data[i][3][0] == 'H':
-            hubs.append(data[i][0])
-        if data[i][3][0] == 'T':
-            terminals.append(data[i][0])
-    
-    for i in data:
-        for j in range(len(data[i])):
-            if data[i][j] == 'NUMBER':
-                num_planes = int(data[i][-1][:-1])
-                break
-            if data[i][j] == 'HORIZON':
-                try:
-                    time_horizon = int(data[i][-1][:-1])
-                except:
-                    time_horizon = float(data[i][-1][:-1])
-                break
-            if data[i][j] == 'RESOLUTION':
-                try:
-                    time_resolution = int(data[i][-1][:-1])
-                except:
-                    time_resolution = float(data[i][-1][:-1])
-                break
-            if data[i][j] == 'LIMIT':
-                try:
-                    weight_limit = int(data[i][-1][:-1])
-                except:
-                    weight_limit = float(data[i][-1][:-1])
-                break
-            if data[i][j] == 'AIRPORT':
-                try:
-                    airport_cost = int(data[i][-1][:-1])
-                except:
-                    airport_cost = float(data[i][-1][:-1])
-                break
-            if data[i][j] == 'PLANE' and data[i][j+1] == 'FIXED' and j == 0:
-                try:
-                    plane_cost = int(data[i][-1][:-1])
-                except:
-                    plane_cost = float(data[i][-1][:-1])
-                break
-            if data[i][j] == 'FUEL':
-                try:
-                    fuel_cost = int(data[i][-1][:-1])
-                except:
-                    fuel_cost = float(data[i][-1][:-1])
-                break
-            if data[i][j] == 'SPEED':
-                try:
-                    plane_speed = int(data[i][-1][:-1])
-                except:
-                    plane_speed = float(data[i][-1][:-1])
-                break
+    # Read in the instance data and the time-expanded network, the network is
+    # cached next to the instance file. The refinement builds its own partial
+    # networks and returns the last one.
+    instance = read_instance(full_instance_path)
+    if method == "refinement":
+        model, network, x, y = solve_refinement(instance, coarse_resolution=coarse_resolution)
+    else:
+        network = compile_network(instance, cache_dir=os.path.dirname(os.path.abspath(full_instance_path)))
+
+    if method == "refinement":
+        pass
+    elif method == "benders":
+        model, x, y = solve_benders(instance, network)
+    elif method == "slope_scaling":
+        model, x, y = solve_slope_scaling(instance, network, time_limit=time_limit)
+    elif method is None:
+        model, x, y = build_model(instance, network)
+
+        if warm_start:
+            heuristic, heuristic_x, heuristic_y = solve_slope_scaling(instance, network, time_limit=time_limit)
+            if heuristic._objective is not None:
+                for arc in y:
+                    y[arc].Start = heuristic_y[arc].X
+                for key in x:
+                    x[key].Start = heuristic_x[key].X
+
+        # Solve the model
+        model.update()
+        model.optimize()
+        # If your model is infeasible (but you expect it to not be), comment out the lines below to compute and write out a infeasible subsystem (Might take very long)
+        #model.computeIIS()
+        #model.write("model.ilp")
+    else:
+        raise ValueError("unknown method %r" % method)
 
-    T = [i for i in range(int(time_horizon/time_resolution)+1)]
-
-    demand = {}
-    for i in range(key_demand+1, len(data)+1):
-        try:
-            demand[(data[i][0],data[i][1])] = int(data[i][-1][:-1])
-        except:
-            demand[(data[i][0],data[i][1])] = float(data[i][-1][:-1])
-    
-    for f1 in cities:
-        for f2 in cities:
-            if not (f1,f2) in demand:
-                demand[(f1,f2)] = 0
-
-    # Construct graph --- NOTE: You do not have to use networkx for this task, but it is strongly recommended and necessary for the plotting functions given
-    G = nx.DiGraph()  # Replace with:
-    # G = build_graph(???)  # --- TODO ---
-
-    # Add node to the graph 
-    for t in T:
-        for city in cities:
-            G.add_node((city,t))
-    
-    # Add A_hold to the graph 
-    for t in T[:-1]:
-        for city in cities:
-            G.add_edge((city,t), (city,t+1))
-
-    # Add A_link to the graph
-    for city_start in cities:
-        for city_end in cities:
-            if city_end == city_start:
-                continue
-            fly_time_abs = distance(cities[city_start],cities[city_end])/plane_speed
-            fly_time_ref = math.ceil(fly_time_abs/time_resolution)
-            for t in range(T[-1] - fly_time_ref + 1):
-                G.add_edge((city_start, t), (city_end, t+fly_time_ref))
-
-    # create Commodities
-    facilities = [i for i in cities]
-
-    commodities = {}
-    for arc in G.edges:
-        commodities[arc] = []
-        for f in facilities:
-            for t in T:
-                if nx.has_path(G, (f,t), arc[1]) == True:
-                    commodities[arc].append(f)
-    
-    nx.set_edge_attributes(G, commodities, 'commodities')
+    if model.status == GRB.OPTIMAL:
+        print('\n objective: %g\n' % model.ObjVal)
+
+        for f, arc in x:
+            if x[(f,arc)].x != 0:
+                #print("x_%s_(%s,%s)_(%s,%s) = %s" % (f,arc[0][0], arc[0][1],arc[1][0],arc[1][1],x[(f,arc)].x))
+                print(x[(f, arc)])
         
-    # === Gurobi model ===
+        for arc in network.arcs():
+            if y[arc].x != 0:
+                #print("y_(%s,%s)_(%s,%s) = %s" % (arc[0][0], arc[0][1],arc[1][0],arc[1][1],y[arc].x))
+                print(y[arc])
+
+    else:
+        print("No solution!")
+
+    G = build_graph(network) if graph else None
+    return model, instance.cities, G, x, y
+
+
+def build_model(instance: Instance, network: Network):
+    """Builds the full service network design model
+
+    Args:
+        instance (Instance): Instance data
+        network (Network): Compiled time-expanded network
+
+    Returns:
+        model: Gurobi model, not solved yet
+        x (dict): Dictionary of gurobi variables for the commodity flow {(commodity, arc): variable}
+        y (dict): Dictionary of gurobi variables for the plane flow {arc: variable}
+    """
     model = Model("SND")
+    arcs = network.arcs()
+
+    y = add_plane_variables(model, instance, network)
+    x, load = add_commodity_flows(model, instance, network)
+
+    for a, arc in enumerate(arcs):
+        if a in load:
+            model.addConstr(quicksum(load[a]) <= instance.weight_limit*y[arc])
 
-    # --- Variables ---
+    return model, x, y
 
-    # Commodity arc variables
-    # x (dict): Dictionary of gurobi variables for the commodity flow in the form {(commodity, arc): variable}. 
-    # Arc is an element of G.edges and commodity is an element of cities
-    x = {}  # --- TODO ---
-    for arc in G.edges:
-        for f in facilities:
-            x[(f, arc)] = model.addVar(name="x_%s_(%s,%s)_(%s,%s)" % (f,arc[0][0], arc[0][1],arc[1][0],arc[1][1]), vtype = GRB.CONTINUOUS, lb=0)
+
+def add_plane_variables(model, instance: Instance, network: Network) -> dict:
+    """Adds the plane variables y, their balance and fleet constraints and the objective to the model
+
+    Returns:
+        y (dict): Dictionary of gurobi variables for the plane flow {arc: variable}
+    """
+    arcs = network.arcs()
+    steps = network.steps
+    out_arcs, in_arcs = network.adjacency()
+    start_arcs = [a for a in range(len(arcs)) if arcs[a][0][1] == 0]
+    end_arcs = [a for a in range(len(arcs)) if arcs[a][1][1] == steps]
 
     # Airplane arc variables
-    # y (dict): Dictionary of gurobi variables for the plane flow {arc: variable}
-    y = {}  # --- TODO ---
-    for arc in G.edges:
-        y[arc] = model.addVar(name="y_(%s,%s)_(%s,%s)" % (arc[0][0], arc[0][1],arc[1][0],arc[1][1]), vtype = GRB.INTEGER, lb=0, ub = num_planes)
+    y = {}
+    for arc in arcs:
+        y[arc] = model.addVar(name="y_(%s,%s)_(%s,%s)" % (arc[0][0], arc[0][1],arc[1][0],arc[1][1]), vtype = GRB.INTEGER, lb=0, ub = instance.num_planes)
 
-    # Potentially additional variables ? --- TODO ---
     model.modelSense = GRB.MINIMIZE
-    model.setObjective(quicksum(y[arc]*(airport_cost + fuel_cost*distance(cities[arc[0][0]],cities[arc[1][0]])) for arc in G.edges if arc[0][0] != arc[1][0]) 
-                     + quicksum(y[arc]*plane_cost for arc in G.edges if arc[0][1] == 0))
-                        
-    # --- Constraints
-    # --- TODO ---
+    model.setObjective(quicksum(y[arc]*arc_cost(instance, arc) for arc in arcs)
+                     + quicksum(y[arcs[a]]*instance.plane_cost for a in start_arcs))
+
+    for k, node in enumerate(network.nodes()):
+        if node[-1] != 0 and node[-1] != steps and (out_arcs[k] or in_arcs[k]):
+            model.addConstr(quicksum(y[arcs[a]] for a in out_arcs[k]) == 
+                            quicksum(y[arcs[a]] for a in in_arcs[k]))
+
+    model.addConstr(quicksum(y[arcs[a]] for a in start_arcs) ==
+                    quicksum(y[arcs[a]] for a in end_arcs))
+
+    model.addConstr(quicksum(y[arcs[a]] for a in start_arcs) <= instance.num_planes)
+
+    return y
+
 
+def add_commodity_flows(model, instance: Instance, network: Network, facilities=None):
+    """Adds the flow variables x and the flow balance of the commodities to the model, only for the arcs a commodity can use
+
+    Args:
+        facilities (list): Commodities to add, all cities if None
+
+    Returns:
+        x (dict): Dictionary of gurobi variables for the commodity flow {(commodity, arc): variable}
+        load (dict): Maps the id of every link arc to the list of flow variables on it
+    """
+    arcs = network.arcs()
+    nodes = network.nodes()
+    steps = network.steps
+    if facilities is None:
+        facilities = network.cities
+
+    x = {}
+    load = {a: [] for a in range(len(arcs)) if arcs[a][0][0] != arcs[a][1][0]}
     for f1 in facilities:
-        for v in G.nodes:
+        out_flow = [[] for v in nodes]
+        in_flow = [[] for v in nodes]
+        for a in network.usable(f1):
+            arc = arcs[a]
+            x[(f1, arc)] = model.addVar(name="x_%s_(%s,%s)_(%s,%s)" % (f1,arc[0][0], arc[0][1],arc[1][0],arc[1][1]), vtype = GRB.CONTINUOUS, lb=0)
+            out_flow[network.arc_tail[a]].append(x[(f1, arc)])
+            in_flow[network.arc_head[a]].append(x[(f1, arc)])
+            if a in load:
+                load[a].append(x[(f1, arc)])
+
+        # flow balance, from the variables of the commodity only
+        for k, v in enumerate(nodes):
             if v == (f1, 0):
-                model.addConstr(quicksum(x[(f1, arc)] for arc in G.out_edges(v)) - 
-                                quicksum(x[(f1, arc)] for arc in G.in_edges(v)) ==
-                                quicksum(demand[(f1,fi)] for fi in facilities))
-            
-            elif v[1] == T[-1]:
-                model.addConstr(quicksum(x[(f1, arc)] for arc in G.out_edges(v)) -
-                                quicksum(x[(f1, arc)] for arc in G.in_edges(v)) == 
-                                -demand[(f1, v[0])])
-            
+                rhs = sum(instance.demand[(f1,fi)] for fi in network.cities)
+            elif v[1] == steps:
+                rhs = -instance.demand[(f1, v[0])]
             else:
-                model.addConstr(quicksum(x[(f1, arc)] for arc in G.out_edges(v)) ==
-                                quicksum(x[(f1, arc)] for arc in G.in_edges(v)))
+                rhs = 0
 
-    for node in G.nodes:
-        if node[-1] != 0 and node[-1] != T[-1]:
-            model.addConstr(quicksum(y[arc_out] for arc_out in G.out_edges(node)) == 
-                            quicksum(y[arc_in] for arc_in in G.in_edges(node)))
+            if not out_flow[k] and not in_flow[k] and rhs == 0:
+                continue
+            model.addConstr(quicksum(out_flow[k]) - quicksum(in_flow[k]) == rhs)
 
-    model.addConstr(quicksum(y[arc] for arc in G.edges if arc[0][1] == 0) ==
-                    quicksum(y[arc] for arc in G.edges if arc[1][1] == T[-1]))
+    return x, load
 
-    model.addConstr(quicksum(y[arc] for arc in G.edges if arc[0][1] == 0) <= num_planes)
 
-    for arc in G.edges:
-        if arc[0][0] != arc[1][0]:
-            model.addConstr(quicksum(x[(f, arc)] for f in facilities) <= weight_limit*y[arc])
+def add_city_cuts(model, instance: Instance, network: Network, y):
+    """Adds valid cuts on the plane variables: all demand of a city has to leave it on link arcs and all demand to a city has to arrive on link arcs"""
+    arcs = network.arcs()
+    link = [a for a in range(len(arcs)) if arcs[a][0][0] != arcs[a][1][0]]
+    for city in network.cities:
+        supply = sum(instance.demand[(city, f)] for f in network.cities)
+        arrival = sum(instance.demand[(f, city)] for f in network.cities)
+        model.addConstr(quicksum(instance.weight_limit*y[arcs[a]] for a in link if arcs[a][0][0] == city) >= supply)
+        model.addConstr(quicksum(instance.weight_limit*y[arcs[a]] for a in link if arcs[a][1][0] == city) >= arrival)
 
-    for f in facilities:
-        for arc in G.edges:
-            if arc[0][0] != arc[1][0] and arc[0][0] in terminals and f != arc[0][0]:
-                model.addConstr(x[f, arc] == 0)
 
-    #for node in G.nodes:
-    #    if node[0] in terminals:
-    #        for f in facilities:
-    #            if f != node[0]:
-    #                model.addConstr(quicksum(x[(f, arc)] for arc in G.out_edges(node) if arc[1][0] != node[0]) == 0)
+def arc_cost(instance: Instance, arc) -> float:
+    """Cost of one plane on the arc, 0 for hold arcs"""
+    if arc[0][0] == arc[1][0]:
+        return 0
+    return instance.airport_cost + instance.fuel_cost*distance(instance.cities[arc[0][0]], instance.cities[arc[1][0]])
 
-    # Solve the model
-    model.update()
-    model.optimize()
-    # If your model is infeasible (but you expect it to not be), comment out the lines below to compute and write out a infeasible subsystem (Might take very long)
-    #model.computeIIS()
-    #model.write("model.ilp")
 
-    if model.status == GRB.OPTIMAL:
-        print('\n objective: %g\n' % model.ObjVal)
+def solve_slope_scaling(instance: Instance, network: Network, time_limit=10, max_iterations=30):
+    """Slope scaling primal heuristic
 
-        for f in facilities:
-            for arc in G.edges:
-                if x[(f,arc)].x != 0:
-                    #print("x_%s_(%s,%s)_(%s,%s) = %s" % (f,arc[0][0], arc[0][1],arc[1][0],arc[1][1],x[(f,arc)].x))
-                    print(x[(f, arc)])
-        
-        for arc in G.edges:
-            if y[arc].x != 0:
-                #print("y_(%s,%s)_(%s,%s) = %s" % (arc[0][0], arc[0][1],arc[1][0],arc[1][1],y[arc].x))
-                print(y[arc])
+    Solves the continuous multicommodity flow with a linear cost per unit on every link arc, rounds the loads up to whole planes and repairs the plane schedule with a min-cost plane flow that covers those planes and respects the fleet size. If the fleet is too small for the rounded loads, the schedule leaves planes out at a penalty above the cost of any schedule and the flow is rerouted within the capacity of the planes it has. The slope of an arc starts at plane cost / weight limit and is then set to the plane cost of the repaired schedule per unit of load, or to the penalty per unit of load if the fleet left a plane of the arc out, until the rounded loads repeat or the budget is used.
 
-    else:
-        print("No solution!")
+    Args:
+        instance (Instance): Instance data
+        network (Network): Compiled time-expanded network
+        time_limit (float): Time budget in seconds
+        max_iterations (int): Maximum number of iterations
+
+    Returns:
+        model: Plane schedule model holding the best solution found, model._history lists (iteration, objective, seconds), model._objective is the best objective (None if no schedule was found) and model._flow is the flow LP of x
+        x (dict): Flow variables {(commodity, arc): variable} of the flow LP for the best solution
+        y (dict): Plane variables {arc: variable} of the plane schedule model
+    """
+    start = time.time()
+    arcs = network.arcs()
+    cost = {a: arc_cost(instance, arcs[a]) for a in range(len(arcs))}
+
+    flow = Model("SND slope scaling flow")
+    flow.Params.OutputFlag = 0
+    x, load = add_commodity_flows(flow, instance, network)
+    flow.modelSense = GRB.MINIMIZE
+
+    schedule = Model("SND slope scaling planes")
+    schedule.Params.OutputFlag = 0
+    y = add_plane_variables(schedule, instance, network)
+    # planes the fleet cannot cover, no schedule costs as much as one of them
+    penalty = instance.num_planes*(instance.plane_cost + network.steps*max(cost.values(), default=0)) + 1
+    missing = {a: schedule.addVar(name="missing_%d" % a, obj=penalty) for a in load}
+    cover = {a: schedule.addConstr(y[arcs[a]] + missing[a] >= 0) for a in load}
+
+    slope = {a: cost[a] / instance.weight_limit for a in load}
+    history = []
+    best, best_solution, previous = None, None, None
+    for iteration in range(1, max_iterations+1):
+        for a in load:
+            for var in load[a]:
+                var.Obj = slope[a]
+        flow.optimize()
+        if flow.status != GRB.OPTIMAL:
+            break
+
+        # round the loads up to whole planes and repair the plane schedule
+        amount = {a: sum(var.X for var in load[a]) for a in load}
+        planes = {a: math.ceil(amount[a] / instance.weight_limit - 1e-6) for a in load}
+        for a in load:
+            cover[a].RHS = planes[a]
+        schedule.optimize()
+
+        objective = None
+        if schedule.status == GRB.OPTIMAL:
+            objective = schedule.ObjVal - penalty*sum(var.X for var in missing.values())
+            if any(var.X > 0.5 for var in missing.values()):
+                # fleet size repair: route the flow on the planes of the schedule
+                capacity = [flow.addConstr(quicksum(load[a]) <= instance.weight_limit * round(y[arcs[a]].X)) for a in load if load[a]]
+                flow.optimize()
+                if flow.status == GRB.OPTIMAL:
+                    amount = {a: sum(var.X for var in load[a]) for a in load}
+                else:
+                    objective = None
+                flow.remove(capacity)
+        history.append((iteration, objective, time.time() - start))
+        print("slope scaling iteration %d: objective %s, %.2f s" % (iteration, objective, time.time() - start))
+        if objective is not None and (best is None or objective < best - 1e-6):
+            best = objective
+            best_solution = ({key: x[key].X for key in x}, {arc: round(y[arc].X) for arc in y})
+
+        if schedule.status != GRB.OPTIMAL or planes == previous or time.time() - start > time_limit:
+            break
+        previous = planes
+
+        # new slopes: plane cost of the repaired schedule per unit of load,
+        # planes that fly anyway (repositioning) are free capacity
+        scheduled = {a: round(y[arcs[a]].X) for a in load}
+        for a in load:
+            if missing[a].X > 0.5:
+                # move the flow off the arcs the fleet cannot cover
+                slope[a] = penalty / instance.weight_limit
+            elif amount[a] > 1e-6:
+                slope[a] = cost[a] * scheduled[a] / amount[a]
+            elif scheduled[a] > 0:
+                slope[a] = 0
+
+    # fix both models to the best solution, so their variables hold it
+    if best_solution is not None:
+        flow_value, plane_value = best_solution
+        for key in x:
+            x[key].LB = x[key].UB = flow_value[key]
+        for arc in y:
+            y[arc].LB = y[arc].UB = plane_value[arc]
+        for a in load:
+            cover[a].RHS = 0
+        flow.optimize()
+        schedule.optimize()
+
+    schedule._history = history
+    schedule._objective = best
+    # x belongs to the flow LP, keep it alive as long as the schedule
+    schedule._flow = flow
+    return schedule, x, y
+
+
+def solve_benders(instance: Instance, network: Network, workers=None):
+    """Benders decomposition: the master problem holds the plane variables y with the plane balance and fleet constraints, the commodity flows are checked in LP subproblems and violated capacity is cut off with lazy feasibility cuts
+
+    For an integer master solution, every commodity is first checked alone in its own LP (in parallel on workers threads, each with its own gurobi environment), which gives one disaggregated cut per commodity that does not fit. Only if all of them fit, the joint LP with the shared capacities is solved. The cuts come from the Farkas duals of the infeasible LPs.
+
+    Args:
+        instance (Instance): Instance data
+        network (Network): Compiled time-expanded network
+        workers (int): Number of threads for the commodity subproblems, one per commodity if None
 
-    return model, cities, G, x, y
+    Returns:
+        model: Master model after solving
+        x (dict): Flow variables {(commodity, arc): variable} of the joint subproblem, solved for the final y
+        y (dict): Plane variables {arc: variable} of the master
+    """
+    arcs = network.arcs()
+    link = [a for a in range(len(arcs)) if arcs[a][0][0] != arcs[a][1][0]]
+
+    master = Model("SND master")
+    y = add_plane_variables(master, instance, network)
+    add_city_cuts(master, instance, network, y)
+
+    # subproblems: capacity rows sum_f x[f,a] <= W*y[a] with the master value
+    # of y as right-hand side
+    def subproblem(facilities, env):
+        model = Model("SND flow", env=env)
+        model.Params.OutputFlag = 0
+        model.Params.InfUnbdInfo = 1
+        model.Params.Method = 1
+        x, load = add_commodity_flows(model, instance, network, facilities)
+        capacity = {a: model.addConstr(quicksum(load[a]) <= 0) for a in link if load[a]}
+        model.update()
+        return model, x, capacity
+
+    envs = [Env(params={"OutputFlag": 0}) for f in network.cities]
+    singles = [subproblem([f], env) for f, env in zip(network.cities, envs)]
+    joint, x, joint_capacity = subproblem(None, envs[0])
+    pool = ThreadPoolExecutor(workers or len(singles))
+    master._cuts = 0
+
+    def feasibility_cut(model, capacity):
+        # Farkas certificate of the infeasible LP: lambda'b(y) >= 0 for every
+        # y with a feasible flow, with b(y) = W*y on the capacity rows
+        model.optimize()
+        if model.status != GRB.INFEASIBLE:
+            return None
+        constant = 0
+        coefficient = {}
+        capacity_rows = set(capacity.values())
+        for row, dual in zip(model.getConstrs(), model.FarkasDual):
+            if dual == 0:
+                continue
+            if row not in capacity_rows:
+                constant += dual * row.RHS
+        for a, row in capacity.items():
+            dual = row.FarkasDual
+            if dual != 0:
+                coefficient[a] = dual * instance.weight_limit
+        return constant, coefficient
+
+    def set_capacity(capacity, y_value):
+        for a, row in capacity.items():
+            row.RHS = instance.weight_limit * y_value[arcs[a]]
+
+    def callback(model, where):
+        if where != GRB.Callback.MIPSOL:
+            return
+        y_value = model.cbGetSolution(y)
+
+        def check(single):
+            sub, sub_x, capacity = single
+            set_capacity(capacity, y_value)
+            return feasibility_cut(sub, capacity)
+
+        cuts = [cut for cut in pool.map(check, singles) if cut is not None]
+        if not cuts:
+            set_capacity(joint_capacity, y_value)
+            cut = feasibility_cut(joint, joint_capacity)
+            if cut is not None:
+                cuts.append(cut)
+
+        for constant, coefficient in cuts:
+            model.cbLazy(constant + quicksum(c*y[arcs[a]] for a, c in coefficient.items()) >= 0)
+            model._cuts += 1
+
+    master.Params.LazyConstraints = 1
+    master.optimize(callback)
+    pool.shutdown()
+    print("Benders: %d feasibility cuts" % master._cuts)
+
+    # flows for the final plane schedule
+    if master.SolCount > 0:
+        set_capacity(joint_capacity, {arc: y[arc].X for arc in arcs})
+        joint.Params.InfUnbdInfo = 0
+        joint.optimize()
+
+    return master, x, y
+
+
+def solve_refinement(instance: Instance, coarse_resolution=None, mip_gap=0.01, max_iterations=100):
+    """Dynamic discretization discovery: solves the model on a partially time-expanded network and refines its time points until the solution is valid at the time resolution of the instance
+
+    The partial network of compile_partial_network is a relaxation of the full one. Every link arc with planes on it that is shorter than the flying time gets the time point of its real arrival added at its destination. Without short arcs in use, the solution is one of the full network and, as it is optimal for the relaxation, optimal. The full network is never built. The partial models get the cuts of add_city_cuts and are solved up to mip_gap until no short arcs are used, then once more to optimality.
+
+    Args:
+        instance (Instance): Instance data
+        coarse_resolution (float): Spacing of the initial time points in hours, a quarter of the time horizon if None
+        mip_gap (float): Relative gap of the partial models before the last one, the gurobi default if None
+        max_iterations (int): Maximum number of refinements
+
+    Returns:
+        model: Model of the last partial network, model._history lists (iteration, time points, arcs, bound, short arcs, seconds) and model._converged tells whether its solution is valid at the time resolution
+        network (Network): Last partial network
+        x (dict): Flow variables {(commodity, arc): variable}
+        y (dict): Plane variables {arc: variable}
+    """
+    start = time.time()
+    cities = list(instance.cities)
+    n = len(cities)
+    steps = int(instance.time_horizon/instance.time_resolution)
+    if coarse_resolution is None:
+        coarse_resolution = instance.time_horizon/4
+    stride = max(1, round(coarse_resolution/instance.time_resolution))
+    fly = {(c1, c2): fly_steps(instance, cities[c1], cities[c2]) for c1 in range(n) for c2 in range(n) if c1 != c2}
+
+    # coarse grid, the earliest arrival keeps link arcs from ending at time 0
+    points = []
+    for c2 in range(n):
+        earliest = min([fly[(c1, c2)] for c1 in range(n) if c1 != c2] + [steps])
+        points.append(sorted(set(range(0, steps+1, stride)) | {0, steps, earliest}))
+
+    history = []
+    short = set()
+    gap = mip_gap
+    for iteration in range(1, max_iterations+1):
+        network = compile_partial_network(instance, points)
+        model, x, y = build_model(instance, network)
+        add_city_cuts(model, instance, network, y)
+        model.Params.OutputFlag = 0
+        if gap is not None:
+            model.Params.MIPGap = gap
+        model.optimize()
+        if model.status != GRB.OPTIMAL:
+            break
+
+        # arrivals of used link arcs that are missing in the partial network
+        arcs = network.arcs()
+        short = set()
+        for a, (tail, head) in enumerate(zip(network.arc_tail.tolist(), network.arc_head.tolist())):
+            c1, c2 = tail % n, head % n
+            if c1 == c2 or y[arcs[a]].X < 0.5:
+                continue
+            arrival = tail//n + fly[(c1, c2)]
+            if head//n != arrival:
+                short.add((c2, arrival))
+
+        history.append((iteration, sum(len(p) for p in points), len(arcs), model.ObjBound, len(short), time.time() - start))
+        print("refinement iteration %d: %d time points, %d arcs, bound %g, %d short arcs, %.2f s" % history[-1])
+        if not short:
+            # a solution within the gap has no short arcs, check the optimum
+            if gap is None:
+                break
+            gap = None
+            continue
+        for c, t in short:
+            bisect.insort(points[c], t)
+
+    model._history = history
+    model._converged = model.status == GRB.OPTIMAL and not short
+    if not model._converged:
+        print("refinement stopped before the solution was valid at the time resolution")
+    return model, network, x, y
 
 def distance(a:tuple, b:tuple) -> float:
     d = ( (a[0] - b[0])**2 + (a[1] - b[1])**2 )**0.5
     return d
 
 
-# --- TODO ---
-# This function is missing not only its content but also a proper signature (which arguments do you want to pass?) as well as documentation!
-# As a sidenote, in most code editors you can add function comment strings like below automatically with a key combination. For VSC, the extension autoDocstring is necessary.
-def build_graph(some_argument, another_argument):
-    """Constructs the time-expanded network
+@dataclass
+class Instance:
+    """Instance data of the service network design problem
+
+    Attributes:
+        cities (dict): Maps city names to their location in the 2D plane, in file order
+        hubs (list): Names of the hub cities
+        terminals (list): Names of the terminal cities
+        demand (dict): Maps (origin, destination) to the amount to ship, 0 for pairs not in the file
+    """
+    num_planes: int = 0
+    time_horizon: float = 0
+    time_resolution: float = 1
+    weight_limit: float = 0
+    airport_cost: float = 0
+    plane_cost: float = 0
+    fuel_cost: float = 0
+    plane_speed: float = 1
+    cities: dict = field(default_factory=dict)
+    hubs: list = field(default_factory=list)
+    terminals: list = field(default_factory=list)
+    demand: dict = field(default_factory=dict)
+
+
+# Header lines of an instance file and the Instance attribute they set
+HEADERS = {
+    'NUMBER PLANES': 'num_planes',
+    'TIME HORIZON': 'time_horizon',
+    'TIME RESOLUTION': 'time_resolution',
+    'WEIGHT LIMIT': 'weight_limit',
+    'AIRPORT FIXED COST': 'airport_cost',
+    'PLANE FIXED COST': 'plane_cost',
+    'FUEL COST': 'fuel_cost',
+    'PLANE SPEED': 'plane_speed',
+}
+
+
+def read_instance(full_instance_path) -> Instance:
+    """Reads in instance data in a single pass over the file
 
     Args:
-        some_argument (datatype): What is this?
-        another_argument (datatype): Good documentation is important!
+        full_instance_path (string): Path to the instance file to read in
 
     Returns:
-        nx.DiGraph: Graph of the time-expanded network
+        Instance: Typed instance data
     """
+    instance = Instance()
+    section = None
 
-    # New directed graph
-    G = nx.DiGraph()
+    with open(full_instance_path) as data:
+        for line in data:
+            words = line.split()
+            if not words:
+                continue
+
+            if words[0] in ('CITIES', 'DEMAND'):
+                section = words[0]
+            elif section == 'CITIES':
+                name = words[0]
+                instance.cities[name] = (parse_number(words[1]), parse_number(words[2]))
+                if words[3][0] == 'H':
+                    instance.hubs.append(name)
+                if words[3][0] == 'T':
+                    instance.terminals.append(name)
+            elif section == 'DEMAND':
+                instance.demand[(words[0], words[1])] = parse_number(words[2])
+            else:
+                key = ' '.join(words[:-1])
+                if key not in HEADERS:
+                    raise ValueError("unknown line in %s: %s" % (full_instance_path, line.strip()))
+                setattr(instance, HEADERS[key], parse_number(words[-1]))
 
-    # Adding nodes --- TODO ---
+    for f1 in instance.cities:
+        for f2 in instance.cities:
+            instance.demand.setdefault((f1, f2), 0)
 
-    # Adding arcs (with attributes) --- TODO ---
+    return instance
 
-    return G
+
+def parse_number(text: str):
+    """int if the text is an integer, float otherwise"""
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
 
 
-# --- TODO ---
-# Same to-dos as for build_graph()
-def read_instance(full_instance_path): #to create the dict of cities 
-    """Reads in instance data
+@dataclass
+class Network:
+    """Compiled time-expanded network on integer ids
+
+    Node t*len(cities)+c is (cities[c], t), in a partial network the nodes
+    off its time points have no arcs. Arc a goes from node arc_tail[a] to
+    node arc_head[a]. The arcs commodity cities[f] can use are
+    usable_arcs[usable_ptr[f]:usable_ptr[f+1]]. The lists of nodes, arcs and
+    adjacency are built on first use and shared by all callers, they must not
+    be modified.
+    """
+    cities: list
+    steps: int
+    arc_tail: np.ndarray
+    arc_head: np.ndarray
+    usable_ptr: np.ndarray
+    usable_arcs: np.ndarray
+    _nodes: list = field(default=None, init=False, repr=False, compare=False)
+    _arcs: list = field(default=None, init=False, repr=False, compare=False)
+    _adjacency: tuple = field(default=None, init=False, repr=False, compare=False)
+
+    def node(self, k):
+        return (self.cities[k % len(self.cities)], k // len(self.cities))
+
+    def nodes(self):
+        if self._nodes is None:
+            self._nodes = [(city, t) for t in range(self.steps + 1) for city in self.cities]
+        return self._nodes
+
+    def arcs(self):
+        if self._arcs is None:
+            nodes = self.nodes()
+            self._arcs = [(nodes[tail], nodes[head]) for tail, head in zip(self.arc_tail.tolist(), self.arc_head.tolist())]
+        return self._arcs
+
+    def adjacency(self):
+        """Lists of outgoing and incoming arc ids for every node"""
+        if self._adjacency is None:
+            out_arcs = [[] for k in range((self.steps + 1)*len(self.cities))]
+            in_arcs = [[] for k in range((self.steps + 1)*len(self.cities))]
+            for a, (tail, head) in enumerate(zip(self.arc_tail.tolist(), self.arc_head.tolist())):
+                out_arcs[tail].append(a)
+                in_arcs[head].append(a)
+            self._adjacency = out_arcs, in_arcs
+        return self._adjacency
+
+    def usable(self, city):
+        f = self.cities.index(city)
+        return self.usable_arcs[self.usable_ptr[f]:self.usable_ptr[f+1]].tolist()
+
+
+# Version of the arrays compile_network stores, part of network_key so a
+# change of their layout does not load old cache files
+NETWORK_FORMAT = 1
+
+
+def network_key(instance: Instance) -> str:
+    """Hash of everything the time-expanded network depends on, the demand is not part of it"""
+    content = json.dumps([NETWORK_FORMAT, list(instance.cities.items()), instance.terminals, instance.time_horizon,
+                          instance.time_resolution, instance.plane_speed])
+    return hashlib.sha1(content.encode()).hexdigest()[:16]
+
+
+def compile_network(instance: Instance, cache_dir=None) -> Network:
+    """Constructs the time-expanded network as arrays, together with the arcs every commodity can use
 
     Args:
-        full_instance_path (string): Path to the instance file to read in
+        instance (Instance): Instance data
+        cache_dir (string): If given, the network is loaded from / saved to a .npz file in this directory, keyed by network_key
+
+    Returns:
+        Network: Compiled time-expanded network
+    """
+    cities = list(instance.cities)
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, 'network.%s.npz' % network_key(instance))
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                return Network(cities, int(cached['steps']), cached['arc_tail'], cached['arc_head'],
+                               cached['usable_ptr'], cached['usable_arcs'])
+
+    n = len(cities)
+    steps = int(instance.time_horizon/instance.time_resolution)
+    tails, heads = [], []
+
+    # A_hold
+    for t in range(steps):
+        for c in range(n):
+            tails.append(t*n + c)
+            heads.append((t+1)*n + c)
+
+    # A_link
+    for c1, city_start in enumerate(cities):
+        for c2, city_end in enumerate(cities):
+            if c1 == c2:
+                continue
+            fly_time_ref = fly_steps(instance, city_start, city_end)
+            for t in range(steps - fly_time_ref + 1):
+                tails.append(t*n + c1)
+                heads.append((t+fly_time_ref)*n + c2)
+
+    usable_ptr, usable_arcs = commodity_arcs(instance, steps, tails, heads)
+    network = Network(cities, steps, np.array(tails, dtype=np.int64), np.array(heads, dtype=np.int64),
+                      np.array(usable_ptr, dtype=np.int64), np.array(usable_arcs, dtype=np.int64))
+    if cache_path is not None:
+        np.savez(cache_path, steps=steps, arc_tail=network.arc_tail, arc_head=network.arc_head,
+                 usable_ptr=network.usable_ptr, usable_arcs=network.usable_arcs)
+    return network
+
+
+def compile_partial_network(instance: Instance, points) -> Network:
+    """Constructs a partially time-expanded network that only has nodes at the given time points
+
+    The node ids are the ones of the full network, nodes not in points have no arcs. Hold arcs connect consecutive time points of a city. A link arc leaving (c1,t) ends at the latest time point of c2 not after the arrival t + flying time, so it can be too short but never too long and every solution of the full network has a solution of the same cost here.
+
+    Args:
+        instance (Instance): Instance data
+        points (list): Sorted time steps of every city (in the order of instance.cities), each list has to contain 0, the last step and the earliest arrival at the city
 
     Returns:
-        (some datatype(s)): what do you want to return?
+        Network: Compiled partially time-expanded network
     """
+    cities = list(instance.cities)
+    n = len(cities)
+    steps = int(instance.time_horizon/instance.time_resolution)
+    tails, heads = [], []
+
+    # A_hold
+    for c in range(n):
+        for t1, t2 in zip(points[c], points[c][1:]):
+            tails.append(t1*n + c)
+            heads.append(t2*n + c)
+
+    # A_link
+    for c1, city_start in enumerate(cities):
+        for c2, city_end in enumerate(cities):
+            if c1 == c2:
+                continue
+            fly_time_ref = fly_steps(instance, city_start, city_end)
+            for t in points[c1]:
+                if t + fly_time_ref > steps:
+                    break
+                arrival = points[c2][bisect.bisect_right(points[c2], t + fly_time_ref) - 1]
+                tails.append(t*n + c1)
+                heads.append(arrival*n + c2)
 
-    some_stuff = {}
+    usable_ptr, usable_arcs = commodity_arcs(instance, steps, tails, heads)
+    return Network(cities, steps, np.array(tails, dtype=np.int64), np.array(heads, dtype=np.int64),
+                   np.array(usable_ptr, dtype=np.int64), np.array(usable_arcs, dtype=np.int64))
 
-    data = open(full_instance_path)
 
-    i = 1
-    for line in data:
-        line = line.split(' ')
-        some_stuff[i] = line
-        i += 1
+def fly_steps(instance: Instance, city_start, city_end) -> int:
+    """Flying time between two cities in time steps, rounded up to the time resolution"""
+    fly_time_abs = distance(instance.cities[city_start], instance.cities[city_end])/instance.plane_speed
+    return math.ceil(fly_time_abs/instance.time_resolution)
 
-    return some_stuff
 
-def return_key(dict_: dict, value_: str) -> int:
-    for i in dict_:
-        if value_ in dict_[i][0]:
-            return i
+def commodity_arcs(instance: Instance, steps, tails, heads):
+    """Arcs every commodity can use in a network on node ids t*len(cities)+c
+
+    Commodity f can use an arc if its tail is reachable from (f,0) and the arc
+    is not a link leaving a terminal other than f, goods are not transshipped
+    at terminals. One search per facility.
+
+    Returns:
+        usable_ptr (list), usable_arcs (list): The arcs of commodity f are usable_arcs[usable_ptr[f]:usable_ptr[f+1]]
+    """
+    cities = list(instance.cities)
+    n = len(cities)
+    out_arcs = [[] for k in range((steps+1)*n)]
+    for a in range(len(tails)):
+        out_arcs[tails[a]].append(a)
+
+    terminal = [city in instance.terminals for city in cities]
+    usable_ptr, usable_arcs = [0], []
+    for f in range(n):
+        seen = [False] * len(out_arcs)
+        seen[f] = True
+        stack = [f]
+        while stack:
+            v = stack.pop()
+            for a in out_arcs[v]:
+                c = v % n
+                if terminal[c] and c != f and heads[a] % n != c:
+                    continue
+                usable_arcs.append(a)
+                if not seen[heads[a]]:
+                    seen[heads[a]] = True
+                    stack.append(heads[a])
+        usable_ptr.append(len(usable_arcs))
+    return usable_ptr, usable_arcs
+
+
+def build_graph(network: Network) -> nx.DiGraph:
+    """Constructs the time-expanded network as networkx graph, needed for the plotting functions
+
+    Args:
+        network (Network): Compiled time-expanded network
+
+    Returns:
+        nx.DiGraph: Graph of the time-expanded network, each arc has the list of commodities that can use it as attribute "commodities"
+    """
+    G = nx.DiGraph()
+    G.add_nodes_from(network.nodes())
+
+    arcs = network.arcs()
+    commodities = {arc: [] for arc in arcs}
+    for f in network.cities:
+        for a in network.usable(f):
+            commodities[arcs[a]].append(f)
+    G.add_edges_from((arc[0], arc[1], {'commodities': commodities[arc]}) for arc in arcs)
+
+    return G
 
 
 if __name__ == "__main__":
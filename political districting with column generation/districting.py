@@ -0,0 +1,771 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from gurobipy import *
+import csv
+import multiprocessing
+import os
+import sys
+import time
+
+
+# Political districting as set partitioning: every column (pattern) is a
+# contiguous district around a center unit with cost sum of the hop distances
+# of its units to the center, the master picks num_districts of them that
+# cover every unit once. Columns come from one pricing problem per center.
+def solve(full_instance_path, max_columns=None, columns_per_center=5, max_iterations=1000, workers=None, early_stop=None, smoothing=0, log=None):
+    """Solving function, takes an instance file, runs the column generation at the root and solves the integer master on the generated patterns (price-and-branch), after a dive for more patterns if they have no districting
+
+    Args:
+        full_instance_path (string): Path to the instance file to read in
+        max_columns (int): Maximum number of columns added per iteration, see solve_column_generation
+        columns_per_center (int): Maximum number of columns taken from the pricing problem of one center
+        max_iterations (int): Maximum number of column generation iterations
+        workers (int): Number of pricing processes, see solve_column_generation
+        early_stop (int): Number of columns after which the exact pricing stops, see solve_column_generation
+        smoothing (float): Weight of the stability center in the dual smoothing, see solve_column_generation
+        log (string): Path of a csv table with a row per column generation iteration
+
+    Returns:
+        model: Gurobi model of the integer master after solving, model._root is the objective at the root node
+        instance (Instance): Instance data
+        pool (PatternPool): Generated patterns, pattern i is the variable lambda[i] of the model
+    """
+    instance = read_instance(full_instance_path)
+    master, pool = solve_column_generation(instance, max_columns=max_columns, columns_per_center=columns_per_center, max_iterations=max_iterations, workers=workers, early_stop=early_stop, smoothing=smoothing, log=log)
+    root = master.ObjVal
+
+    print('\noptimal objective at the root node: %s' % root)
+    if master._bound is not None:
+        print('Lagrangian bound at the root node: %s' % master._bound)
+    print('number of total patterns we have: ', len(pool))
+
+    solve_integer_master(master)
+    if master._artificial_used:
+        print('no districting among the generated patterns, diving for one')
+        if dive(instance, master, pool, columns_per_center=columns_per_center):
+            solve_integer_master(master)
+    master._root = root
+    if master.SolCount > 0 and not master._artificial_used:
+        print('objective of the districting: %g (gap to the root %.2f%%)' % (master.ObjVal, max(0, 100*(master.ObjVal - root)/max(abs(master.ObjVal), 1e-9))))
+        for index, var in enumerate(master._lambda):
+            if var.X > 0.5:
+                print('lambda[%d] = %.4f' % (index, var.X))
+                print('    center %s: %s' % (instance.units[pool[index].center], sorted(instance.units[i] for i in pool[index].units)))
+    else:
+        print('No districting among the generated patterns!')
+
+    return master, instance, pool
+
+
+@dataclass
+class Instance:
+    """Instance data of the districting problem
+
+    Attributes:
+        units (list): Unit names in file order, a unit id is the position in this list
+        population (list): Population of every unit id
+        neighbors (list): Ids of the adjacent units of every unit id
+        num_districts (int): Number of districts to build
+        tolerance (float): Allowed relative deviation of the population of a district from the average
+    """
+    num_districts: int = 0
+    tolerance: float = 0
+    units: list = field(default_factory=list)
+    population: list = field(default_factory=list)
+    neighbors: list = field(default_factory=list)
+
+    def population_bounds(self):
+        """Smallest and largest population of a district"""
+        average = sum(self.population) / self.num_districts
+        return (1 - self.tolerance) * average, (1 + self.tolerance) * average
+
+
+# Header lines of an instance file and the Instance attribute they set
+HEADERS = {
+    'DISTRICTS': 'num_districts',
+    'POPULATION TOLERANCE': 'tolerance',
+}
+
+
+def read_instance(full_instance_path) -> Instance:
+    """Reads in instance data in a single pass over the file
+
+    The header lines DISTRICTS and POPULATION TOLERANCE are followed by a
+    UNITS section with lines "<unit> <population>" and an ADJACENCY section
+    with lines "<unit> <unit>" for every pair of adjacent units.
+
+    Args:
+        full_instance_path (string): Path to the instance file to read in
+
+    Returns:
+        Instance: Typed instance data on integer unit ids
+    """
+    instance = Instance()
+    unit_id = {}
+    section = None
+
+    with open(full_instance_path) as data:
+        for line in data:
+            words = line.split()
+            if not words:
+                continue
+
+            if words[0] in ('UNITS', 'ADJACENCY'):
+                section = words[0]
+            elif section == 'UNITS':
+                unit_id[words[0]] = len(instance.units)
+                instance.units.append(words[0])
+                instance.population.append(int(words[1]))
+                instance.neighbors.append([])
+            elif section == 'ADJACENCY':
+                u, v = unit_id[words[0]], unit_id[words[1]]
+                if v not in instance.neighbors[u]:
+                    instance.neighbors[u].append(v)
+                    instance.neighbors[v].append(u)
+            else:
+                key = ' '.join(words[:-1])
+                if key not in HEADERS:
+                    raise ValueError("unknown line in %s: %s" % (full_instance_path, line.strip()))
+                setattr(instance, HEADERS[key], parse_number(words[-1]))
+
+    return instance
+
+
+def parse_number(text: str):
+    """int if the text is an integer, float otherwise"""
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def hop_distances(instance: Instance) -> list:
+    """Number of adjacencies on a shortest path between every pair of unit ids, None if there is no path"""
+    distances = []
+    for center in range(len(instance.units)):
+        distance = [None] * len(instance.units)
+        distance[center] = 0
+        queue = deque([center])
+        while queue:
+            u = queue.popleft()
+            for v in instance.neighbors[u]:
+                if distance[v] is None:
+                    distance[v] = distance[u] + 1
+                    queue.append(v)
+        distances.append(distance)
+    return distances
+
+
+@dataclass
+class Pattern:
+    """District of the master problem
+
+    Attributes:
+        units (frozenset): Unit ids of the district
+        center (int): Unit id of its center
+        cost (float): Sum of the hop distances of the units to the center
+    """
+    units: frozenset
+    center: int
+    cost: float
+
+
+class PatternPool:
+    """Patterns of the master problem, indexed by the hash of their unit set so that every district is a column only once"""
+
+    def __init__(self):
+        self.patterns = []
+        self.index = {}
+
+    def add(self, units, center, cost):
+        """Adds a pattern, returns its index and whether it is new. A known district only changes if the new center is cheaper, then the index is returned with False, otherwise None."""
+        key = frozenset(units)
+        index = self.index.get(key)
+        if index is None:
+            self.index[key] = len(self.patterns)
+            self.patterns.append(Pattern(key, center, cost))
+            return len(self.patterns) - 1, True
+        if cost < self.patterns[index].cost - 1e-9:
+            self.patterns[index] = Pattern(key, center, cost)
+            return index, False
+        return None, False
+
+    def __contains__(self, units):
+        return frozenset(units) in self.index
+
+    def __getitem__(self, index):
+        return self.patterns[index]
+
+    def __iter__(self):
+        return iter(self.patterns)
+
+    def __len__(self):
+        return len(self.patterns)
+
+
+def initial_districting(instance: Instance, distances):
+    """Greedy districting to start the column generation from
+
+    The centers are spread out by taking the unit farthest from the centers
+    chosen so far, then the district with the smallest population takes its
+    closest unassigned neighboring unit until every unit is assigned. The
+    growth ignores the population bounds, so only the districts that are
+    columns of the pricing problems (is_district) are returned, the
+    artificial variables of build_master cover the rest.
+
+    Returns:
+        list: (units, center, cost) of the valid districts
+    """
+    centers = [0]
+    while len(centers) < instance.num_districts:
+        centers.append(max(range(len(instance.units)), key=lambda i: min(distances[c][i] if distances[c][i] is not None else len(instance.units) for c in centers)))
+
+    district = {c: c for c in centers}
+    population = {c: instance.population[c] for c in centers}
+    members = {c: [c] for c in centers}
+    while len(district) < len(instance.units):
+        grown = False
+        for c in sorted(centers, key=lambda c: population[c]):
+            frontier = {v for u in members[c] for v in instance.neighbors[u] if v not in district}
+            if frontier:
+                v = min(frontier, key=lambda v: distances[c][v])
+                district[v] = c
+                population[c] += instance.population[v]
+                members[c].append(v)
+                grown = True
+                break
+        if not grown:
+            break
+
+    return [(members[c], c, sum(distances[c][i] for i in members[c])) for c in centers
+            if is_district(instance, distances, members[c], c)]
+
+
+def is_district(instance: Instance, distances, units, center):
+    """Whether the units are a district of the pricing problem of the center (build_pricing): within the population bounds and every unit has a neighbor in the district one hop closer to the center"""
+    lower, upper = instance.population_bounds()
+    units = set(units)
+    distance = distances[center]
+    if center not in units or not lower <= sum(instance.population[i] for i in units) <= upper:
+        return False
+    return all(i == center or (distance[i] is not None and any(j in units and distance[j] == distance[i] - 1 for j in instance.neighbors[i]))
+               for i in units)
+
+
+def build_master(instance: Instance, penalty):
+    """Builds the restricted master LP without patterns
+
+    Every unit row and the row of the number of districts get an artificial
+    variable with cost penalty, so the master is feasible for any set of
+    patterns. The penalty bounds the duals, a large one makes them swing
+    between the bounds and the pricing problems hard, so
+    solve_column_generation starts small and raises it while the optimum
+    still uses artificial variables.
+
+    Args:
+        instance (Instance): Instance data
+        penalty (float): Cost of the artificial variables
+
+    Returns:
+        model: Gurobi model with the rows in model._cover (one per unit id) and model._count, the pattern variables in model._lambda
+    """
+    model = Model('districting master')
+    model.Params.OutputFlag = 0
+    # adding columns keeps the last basis primal feasible, the primal simplex
+    # goes on from it
+    model.Params.Method = 0
+    model.modelSense = GRB.MINIMIZE
+
+    model._artificial = [model.addVar(obj=penalty, name='artificial_%s' % unit) for unit in instance.units]
+    model._artificial.append(model.addVar(obj=penalty, name='artificial_count'))
+    model._cover = [model.addConstr(model._artificial[i] == 1, name='cover_%s' % unit) for i, unit in enumerate(instance.units)]
+    model._count = model.addConstr(model._artificial[-1] == instance.num_districts, name='count')
+    model._lambda = []
+    model.update()
+    return model
+
+
+def add_column(master, pool: PatternPool, index, new):
+    """Adds pattern index of the pool to the master, or updates the cost of its column if it is not new"""
+    pattern = pool[index]
+    if not new:
+        master._lambda[index].Obj = pattern.cost
+        return
+    column = Column([1] * (len(pattern.units) + 1), [master._cover[i] for i in pattern.units] + [master._count])
+    master._lambda.append(master.addVar(obj=pattern.cost, column=column, name='lambda[%d]' % index))
+
+
+def build_pricing(instance: Instance, distances, center, env=None):
+    """Builds the pricing problem of a center: the cheapest contiguous district around it within the population bounds
+
+    Contiguity is modelled by the shortest path trees of the center: a unit
+    can only be in the district if one of its neighbors one hop closer to the
+    center is, so every unit has a path to the center inside the district.
+    The objective coefficients are set by price.
+
+    Args:
+        instance (Instance): Instance data
+        distances (list): Hop distances of hop_distances
+        center (int): Unit id of the center
+        env: Gurobi environment of the model
+
+    Returns:
+        model: Gurobi model with the unit variables in model._y, None for the unit ids the center can not reach
+    """
+    model = Model('pricing %s' % instance.units[center], env=env)
+    model.Params.OutputFlag = 0
+    # many small models are solved side by side, one thread each
+    model.Params.Threads = 1
+    distance = distances[center]
+    lower, upper = instance.population_bounds()
+
+    y = [None] * len(instance.units)
+    for i, d in enumerate(distance):
+        if d is not None and instance.population[i] <= upper:
+            y[i] = model.addVar(vtype='B', name='y_%s' % instance.units[i])
+    y[center].LB = 1
+
+    model.addConstr(quicksum(instance.population[i] * y[i] for i in range(len(y)) if y[i] is not None) >= lower)
+    model.addConstr(quicksum(instance.population[i] * y[i] for i in range(len(y)) if y[i] is not None) <= upper)
+    for i in range(len(y)):
+        if y[i] is None or i == center:
+            continue
+        closer = [y[j] for j in instance.neighbors[i] if y[j] is not None and distance[j] == distance[i] - 1]
+        model.addConstr(y[i] <= quicksum(closer))
+
+    model._y = y
+    model._center = center
+    model.update()
+    return model
+
+
+def price(pricing, distances, duals, count_dual, columns_per_center):
+    """Solves the pricing problem of one center for the current duals
+
+    Returns:
+        list: (reduced cost, units, cost) of the districts in the solution pool of the pricing problem with negative reduced cost
+        float: Lower bound on the reduced cost of the districts of the center, infinite if it has none
+    """
+    y = pricing._y
+    distance = distances[pricing._center]
+    for i, var in enumerate(y):
+        if var is not None:
+            var.Obj = distance[i] - duals[i]
+    pricing.ObjCon = -count_dual
+    pricing.Params.PoolSolutions = columns_per_center
+    pricing.optimize()
+    if pricing.status != GRB.OPTIMAL:
+        return [], GRB.INFINITY
+
+    columns = []
+    for n in range(pricing.SolCount):
+        pricing.Params.SolutionNumber = n
+        if pricing.PoolObjVal >= -1e-6:
+            break
+        units = [i for i, var in enumerate(y) if var is not None and var.Xn > 0.5]
+        columns.append((pricing.PoolObjVal, units, sum(distance[i] for i in units)))
+    return columns, pricing.ObjBound
+
+
+def price_greedy(instance: Instance, distances, center, duals, count_dual):
+    """Heuristic pricing of one center: grows districts from the center with the contiguity rule of build_pricing
+
+    A unit can join once a neighbor one hop closer to the center is in the
+    district and its population fits. Until the district reaches the lower
+    population bound the cheapest such unit (distance minus dual) joins,
+    afterwards only units with negative cost do. It runs once with the cost
+    and once with the cost per inhabitant as order.
+
+    Returns:
+        list: (reduced cost, units, cost) of the distinct districts with negative reduced cost
+    """
+    distance = distances[center]
+    lower, upper = instance.population_bounds()
+
+    columns = []
+    for per_inhabitant in (False, True):
+        units = {center}
+        population = instance.population[center]
+        candidates = {v for v in instance.neighbors[center] if distance[v] == 1}
+        while True:
+            fitting = [v for v in candidates if population + instance.population[v] <= upper]
+            if not fitting:
+                break
+            if per_inhabitant:
+                # a unit without inhabitants counts as one
+                v = min(fitting, key=lambda v: (distance[v] - duals[v]) / max(instance.population[v], 1))
+            else:
+                v = min(fitting, key=lambda v: distance[v] - duals[v])
+            if population >= lower and distance[v] - duals[v] >= 0:
+                break
+            units.add(v)
+            population += instance.population[v]
+            candidates.discard(v)
+            candidates.update(w for w in instance.neighbors[v] if w not in units and distance[w] == distance[v] + 1)
+
+        reduced_cost = sum(distance[i] - duals[i] for i in units) - count_dual
+        if population >= lower and reduced_cost < -1e-6 and all(units != other for r, other, c in columns):
+            columns.append((reduced_cost, units, sum(distance[i] for i in units)))
+    return [(reduced_cost, sorted(units), cost) for reduced_cost, units, cost in columns]
+
+
+# State of a pricing process, set by init_pricing. The pricing models of the
+# centers are built on first use and then kept, so they are warm started
+# whenever the same process gets the center again.
+worker = {}
+
+
+def init_pricing(instance: Instance, distances):
+    worker['instance'] = instance
+    worker['distances'] = distances
+    worker['env'] = Env(params={'OutputFlag': 0})
+    worker['models'] = {}
+
+
+def price_centers(centers, duals, count_dual, exact, columns_per_center):
+    """Prices the given centers in a pricing process, with the MIP of build_pricing if exact and price_greedy otherwise
+
+    Returns:
+        list: (reduced cost, units, cost, center) of the columns with negative reduced cost
+        float: Lower bound on the reduced cost of the districts of the centers, infinite for the greedy pricing
+    """
+    instance, distances, models = worker['instance'], worker['distances'], worker['models']
+    columns = []
+    bound = GRB.INFINITY
+    for center in centers:
+        if exact:
+            if center not in models:
+                models[center] = build_pricing(instance, distances, center, worker['env'])
+            found, center_bound = price(models[center], distances, duals, count_dual, columns_per_center)
+            bound = min(bound, center_bound)
+        else:
+            found = price_greedy(instance, distances, center, duals, count_dual)
+        columns += [(reduced_cost, units, cost, center) for reduced_cost, units, cost in found]
+    return columns, bound
+
+
+def price_all(executor, workers, centers, duals, count_dual, exact, columns_per_center, early_stop=None):
+    """Prices every center, on the workers processes of executor or in this process if it is None
+
+    The greedy pricing is cheap, so the centers are split into one chunk per
+    process. The exact pricing sends every center on its own and, once
+    early_stop columns are found, cancels the centers that have not started.
+
+    Returns:
+        list: (reduced cost, units, cost, center) of the columns with negative reduced cost
+        bool: Every center was priced
+        float: Lower bound on the reduced cost of the districts of the priced centers, see price_centers
+    """
+    if executor is None:
+        columns = []
+        bound = GRB.INFINITY
+        for center in centers:
+            found, center_bound = price_centers([center], duals, count_dual, exact, columns_per_center)
+            columns += found
+            bound = min(bound, center_bound)
+            if exact and early_stop is not None and len(columns) >= early_stop:
+                return columns, center == centers[-1], bound
+        return columns, True, bound
+
+    if exact:
+        chunks = [[center] for center in centers]
+    else:
+        size = -(-len(centers) // workers)
+        chunks = [centers[n:n+size] for n in range(0, len(centers), size)]
+    futures = [executor.submit(price_centers, chunk, duals, count_dual, exact, columns_per_center) for chunk in chunks]
+
+    columns = []
+    bound = GRB.INFINITY
+    pending = set(futures)
+    for future in as_completed(futures):
+        pending.discard(future)
+        found, chunk_bound = future.result()
+        columns += found
+        bound = min(bound, chunk_bound)
+        if exact and early_stop is not None and len(columns) >= early_stop:
+            break
+    # centers that have not started are dropped, started ones still count
+    cancelled = [future for future in pending if future.cancel()]
+    for future in pending:
+        if not future.cancelled():
+            found, chunk_bound = future.result()
+            columns += found
+            bound = min(bound, chunk_bound)
+    return columns, not cancelled, bound
+
+
+# Fields of a row of the history of solve_column_generation: RMP objective,
+# best Lagrangian bound so far, columns added, pricing that found them and
+# seconds of the pricing and since the start
+HISTORY_FIELDS = ['iteration', 'rmp', 'bound', 'columns', 'pricing', 'pricing_time', 'time']
+
+
+def solve_column_generation(instance: Instance, max_columns=None, columns_per_center=5, max_iterations=1000, workers=None, early_stop=None, smoothing=0, gap=1e-6, log=None):
+    """Column generation for the LP relaxation of the master problem
+
+    Every iteration solves the restricted master, then prices every center
+    with price_greedy. Only if that finds no column, the pricing MIPs of
+    build_pricing are solved, up to columns_per_center columns from the
+    solution pool of each, and stopped early once early_stop columns are
+    found. The centers are priced on a pool of workers processes, the
+    exact pricing starts with the centers that had the most negative reduced
+    cost before. The max_columns patterns with the most negative reduced cost
+    that are not in the pool yet are added. The master keeps its basis
+    between iterations.
+
+    The duals are stabilized by Wentges smoothing: the pricing gets
+    smoothing times the duals with the best Lagrangian bound so far plus the
+    rest times the duals of the master, and only the columns with negative
+    reduced cost for the duals of the master are added. If there are none,
+    the same iteration prices again with the duals of the master. Every
+    complete round of pricing MIPs gives the Lagrangian bound of its duals,
+    sum of the duals plus num_districts times the smallest reduced cost (the
+    smallest bound of the pricing MIPs).
+
+    It stops when the master is within gap of the best Lagrangian bound or
+    the pricing MIPs of all centers find no district with negative reduced
+    cost for the duals of the master, and the artificial variables of
+    build_master are 0. Their cost starts at the diameter of the adjacency
+    graph and doubles whenever they are not 0 at the end.
+
+    Args:
+        instance (Instance): Instance data
+        max_columns (int): Maximum number of columns added per iteration, the number of units if None
+        columns_per_center (int): Maximum number of columns of one pricing problem
+        max_iterations (int): Maximum number of iterations
+        workers (int): Number of pricing processes, the cpu count if None, 1 prices in this process
+        early_stop (int): Number of columns after which the exact pricing stops, all centers are priced if None
+        smoothing (float): Weight of the duals of the best Lagrangian bound, 0 turns the smoothing off. It pays off when few columns are added per iteration (0.9 with max_columns=1), with many the master duals are stable enough and it only slows the convergence
+        gap (float): Relative gap between the master and the Lagrangian bound to stop at
+        log (string): Path of a csv table the rows of model._history are written to while it runs
+
+    Returns:
+        model: Restricted master LP after the last iteration, model._history has a dict per iteration with the fields of HISTORY_FIELDS, model._bound is the best Lagrangian bound and model._converged tells whether the master is proven optimal within gap
+        pool (PatternPool): Generated patterns, pattern i is the variable model._lambda[i]
+    """
+    start = time.time()
+    if max_columns is None:
+        max_columns = len(instance.units)
+    distances = hop_distances(instance)
+    penalty = max(d for distance in distances for d in distance if d is not None) + 1
+    # the artificial variables that are still used at this penalty most
+    # likely mean there is no districting within the population bounds
+    max_penalty = penalty * 2**20
+    master = build_master(instance, penalty)
+    pool = PatternPool()
+    for units, center, cost in initial_districting(instance, distances):
+        add_column(master, pool, *pool.add(units, center, cost))
+
+    workers = workers or os.cpu_count()
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'), initializer=init_pricing, initargs=(instance, distances))
+    else:
+        init_pricing(instance, distances)
+    centers = list(range(len(instance.units)))
+    best = {center: 0 for center in centers}
+
+    def add_columns(columns):
+        added = 0
+        for reduced_cost, units, cost, center in sorted(columns, key=lambda column: column[0]):
+            if added >= max_columns:
+                break
+            index, new = pool.add(units, center, cost)
+            if index is None:
+                continue
+            add_column(master, pool, index, new)
+            added += 1
+        return added
+
+    table = None
+    if log is not None:
+        table = open(log, 'w', newline='')
+        writer = csv.DictWriter(table, fieldnames=HISTORY_FIELDS)
+        writer.writeheader()
+    print('%9s %14s %14s %8s %16s %9s %9s' % ('iteration', 'RMP', 'bound', 'columns', 'pricing', 'pricing s', 'total s'))
+
+    history = []
+    converged = False
+    # best Lagrangian bound and the duals (units, then the number of
+    # districts) it comes from, the stability center of the smoothing
+    bound, stability_center = None, None
+    for iteration in range(1, max_iterations+1):
+        master.optimize()
+        duals = master.getAttr('Pi', master._cover) + [master._count.Pi]
+        pricing_start = time.time()
+
+        steps = [(duals, False)]
+        if stability_center is not None and smoothing > 0:
+            steps.insert(0, ([smoothing*a + (1 - smoothing)*b for a, b in zip(stability_center, duals)], True))
+
+        added = 0
+        for step_duals, smoothed in steps:
+            for exact in (False, True):
+                if exact:
+                    centers.sort(key=lambda center: best[center])
+                columns, complete, min_reduced_cost = price_all(executor, workers, centers, step_duals[:-1], step_duals[-1], exact, columns_per_center, early_stop)
+                if exact:
+                    best = {center: 0 for center in centers}
+                    for reduced_cost, units, cost, center in columns:
+                        best[center] = min(best[center], reduced_cost)
+                if exact and complete and min_reduced_cost < GRB.INFINITY:
+                    lagrangian = sum(step_duals[:-1]) + instance.num_districts * (step_duals[-1] + min_reduced_cost)
+                    if bound is None or lagrangian > bound:
+                        bound, stability_center = lagrangian, step_duals
+
+                # reduced costs for the duals of the master
+                columns = [(cost - sum(duals[i] for i in units) - duals[-1], units, cost, center) for reduced_cost, units, cost, center in columns]
+                added = add_columns([column for column in columns if column[0] < -1e-6])
+                pricing = ('exact' if exact else 'greedy') + (' smoothed' if smoothed else '')
+                if added > 0:
+                    break
+            if added > 0:
+                break
+
+        row = {'iteration': iteration, 'rmp': master.ObjVal, 'bound': bound if bound is not None else '', 'columns': added,
+               'pricing': pricing, 'pricing_time': time.time() - pricing_start, 'time': time.time() - start}
+        history.append(row)
+        print('%9d %14.6f %14s %8d %16s %9.3f %9.2f' % (iteration, row['rmp'], '%.6f' % bound if bound is not None else '-', added, pricing, row['pricing_time'], row['time']))
+        if table is not None:
+            writer.writerow(row)
+            table.flush()
+
+        if any(var.X > 1e-6 for var in master._artificial):
+            if added == 0 and complete:
+                if penalty >= max_penalty:
+                    print('the master still uses artificial variables at penalty %g, the population bounds may leave no districting' % penalty)
+                    break
+                penalty *= 2
+                for var in master._artificial:
+                    var.Obj = penalty
+            continue
+        if bound is not None and bound >= master.ObjVal - gap * max(1, abs(master.ObjVal)):
+            converged = True
+            break
+        if added == 0 and complete:
+            converged = True
+            break
+
+    if executor is not None:
+        executor.shutdown(cancel_futures=True)
+    if table is not None:
+        table.close()
+    if not converged:
+        master.optimize()
+    master._history = history
+    master._bound = bound
+    master._converged = converged
+    if not converged:
+        print('column generation stopped before the pricing proved the master optimal')
+    return master, pool
+
+
+def dive(instance: Instance, master, pool: PatternPool, columns_per_center=5, max_doublings=20, max_backtracks=None):
+    """Diving heuristic for a districting when the generated patterns have none
+
+    Fixes the pattern with the largest value in the master LP to 1 and
+    generates columns for the rest, until the LP solution is integer. The
+    pricing runs in this process and leaves out the covered units: they get
+    a dual so low that no district with them has negative reduced cost, and
+    they are no centers. The artificial variables are back in the master
+    while it dives. If they are still used when the pricing finds no column,
+    their cost doubles, up to max_doublings times the cost at the start.
+    After that the last fixed pattern is excluded instead (backtracking), at
+    most max_backtracks times, the number of units if None. Afterwards all
+    patterns are free again, the districting of the dive is among them.
+
+    Returns:
+        bool: Whether the dive found a districting
+    """
+    distances = hop_distances(instance)
+    if worker.get('instance') is not instance:
+        init_pricing(instance, distances)
+    if max_backtracks is None:
+        max_backtracks = len(instance.units)
+    for var in master._lambda:
+        var.vtype = GRB.CONTINUOUS
+    for var in master._artificial:
+        var.UB = GRB.INFINITY
+    master.Params.Method = 0
+    max_penalty = master._artificial[0].Obj * 2**max_doublings
+
+    # fixed patterns with the patterns excluded below each of them
+    stack, excluded = [], []
+    covered = set()
+    backtracks = 0
+    found = False
+    while True:
+        master.optimize()
+        duals = master.getAttr('Pi', master._cover)
+        count_dual = master._count.Pi
+        artificial = any(var.X > 1e-6 for var in master._artificial)
+        if not artificial and all(var.X < 1e-6 or var.X > 1 - 1e-6 for var in master._lambda):
+            found = True
+            break
+
+        low = -sum(abs(dual) for dual in duals) - abs(count_dual) - 1
+        priced = [low if i in covered else dual for i, dual in enumerate(duals)]
+        centers = [center for center in range(len(instance.units)) if center not in covered]
+        added = 0
+        for exact in (False, True):
+            for reduced_cost, units, cost, center in price_all(None, 1, centers, priced, count_dual, exact, columns_per_center)[0]:
+                index, new = pool.add(units, center, cost)
+                if index is not None:
+                    add_column(master, pool, index, new)
+                    added += 1
+            if added > 0:
+                break
+        if added > 0:
+            continue
+
+        if artificial and master._artificial[0].Obj < max_penalty:
+            for var in master._artificial:
+                var.Obj *= 2
+            continue
+
+        free = [index for index, var in enumerate(master._lambda) if var.X > 1e-6 and var.LB == 0 and covered.isdisjoint(pool[index].units)]
+        if not artificial and free:
+            index = max(free, key=lambda index: (master._lambda[index].X, -pool[index].cost))
+            master._lambda[index].LB = 1
+            stack.append((index, []))
+            covered |= pool[index].units
+            continue
+
+        # no districting with the fixed patterns
+        if not stack or backtracks == max_backtracks:
+            break
+        backtracks += 1
+        index, below = stack.pop()
+        for other in below:
+            master._lambda[other].UB = GRB.INFINITY
+        master._lambda[index].LB = 0
+        master._lambda[index].UB = 0
+        (stack[-1][1] if stack else excluded).append(index)
+        covered -= pool[index].units
+
+    for index, below in stack:
+        master._lambda[index].LB = 0
+        excluded += below
+    for index in excluded:
+        master._lambda[index].UB = GRB.INFINITY
+    print('dive %s after %d backtracks, %d patterns in total' % ('found a districting' if found else 'failed', backtracks, len(pool)))
+    return found
+
+
+def solve_integer_master(master):
+    """Price-and-branch: solves the master with binary pattern variables over the generated patterns, without the artificial variables"""
+    for var in master._lambda:
+        var.vtype = GRB.BINARY
+    for var in master._artificial:
+        var.UB = 0
+    master.Params.Method = -1
+    master.optimize()
+    master._artificial_used = master.status != GRB.OPTIMAL
+
+
+if __name__ == "__main__":
+    instance = sys.argv[1] if len(sys.argv) > 1 else './grid69.dat'
+    solve(instance)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+import argparse
+import random
+
+
+# Synthetic districting instances in the format of read_instance: the units
+# are the cells of a grid with random populations, adjacent to the cells to
+# their right and below and, with some probability, diagonally.
+def write_grid_instance(path, rows, cols, num_districts, tolerance=0.1, seed=1, units=None, diagonal=0.3):
+    """Writes a grid instance, the ids of the units are numbered from 4515 in row order
+
+    Args:
+        units (int): Keeps only the first units cells of the grid (all of them if None)
+        diagonal (float): Probability that a cell is adjacent to the cell below and to its right
+    """
+    rng = random.Random(seed)
+    cells = [(r, c) for r in range(rows) for c in range(cols)][:units]
+    ids = {cell: str(4515 + i) for i, cell in enumerate(cells)}
+    with open(path, 'w') as file:
+        file.write('DISTRICTS %d\nPOPULATION TOLERANCE %g\nUNITS\n' % (num_districts, tolerance))
+        for cell in cells:
+            file.write('%s %d\n' % (ids[cell], rng.randint(800, 1200)))
+        file.write('ADJACENCY\n')
+        for r, c in cells:
+            for neighbor in [(r + 1, c), (r, c + 1)] + ([(r + 1, c + 1)] if rng.random() < diagonal else []):
+                if neighbor in ids:
+                    file.write('%s %s\n' % (ids[(r, c)], ids[neighbor]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Writes a synthetic grid districting instance')
+    parser.add_argument('output', nargs='?', default='grid69.dat')
+    parser.add_argument('--rows', type=int, default=7)
+    parser.add_argument('--cols', type=int, default=10)
+    parser.add_argument('--districts', type=int, default=4)
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--units', type=int, default=69, help='first cells of the grid to keep')
+    args = parser.parse_args()
+    write_grid_instance(args.output, args.rows, args.cols, args.districts, args.tolerance, args.seed, args.units)
@@ -0,0 +1,124 @@
+import argparse
+import contextlib
+import csv
+import glob
+import multiprocessing
+import os
+import sys
+import time
+
+import timetables
+
+FIELDS = ['instance', 'status', 'objective', 'bound', 'gap', 'build_time', 'solve_time',
+          'callback_time', 'lazy_cuts', 'heuristic_time', 'polish_time', 'wall_time', 'error']
+
+
+# Solves every instance of a glob on a process pool, writes one row per
+# instance to a csv table and compares it to a stored baseline table. The
+# solver output of an instance goes to <instance>.log next to the table. The
+# time limit is the budget of the local search, the polish and the MIP
+# together, solve_time is the time of all three (heuristic_time and
+# polish_time are parts of it), like callback_time and lazy_cuts.
+def run(job):
+    path, threads, time_limit, log_dir = job
+    row = dict.fromkeys(FIELDS, '')
+    row['instance'] = os.path.basename(path)
+    start = time.time()
+    with open(os.path.join(log_dir, row['instance'] + '.log'), 'w') as log, contextlib.redirect_stdout(log):
+        try:
+            model = timetables.solve(path, time_budget=time_limit, threads=threads)
+        except Exception as error:
+            row['status'] = 'error'
+            row['error'] = str(error)
+            row['wall_time'] = time.time() - start
+            return row
+
+    row['status'] = model.status
+    if model.SolCount > 0:
+        row['objective'] = model.ObjVal
+        row['gap'] = model.MIPGap
+    row['bound'] = model.ObjBound
+    row['build_time'] = model._build_time
+    row['solve_time'] = model._heuristic_time + model._polish_time + model._solve_time
+    row['callback_time'] = model._callback_time
+    row['lazy_cuts'] = model._lazy_cuts
+    row['heuristic_time'] = model._heuristic_time
+    row['polish_time'] = model._polish_time
+    row['wall_time'] = time.time() - start
+    return row
+
+
+def benchmark(pattern, workers=None, threads=1, time_limit=60, output='results.csv'):
+    paths = sorted(glob.glob(pattern))
+    if not paths:
+        raise ValueError('no instances match %s' % pattern)
+    log_dir = os.path.dirname(os.path.abspath(output))
+    jobs = [(path, threads, time_limit, log_dir) for path in paths]
+
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers or min(len(jobs), max(1, os.cpu_count() // threads))) as pool:
+        results = sorted(pool.imap_unordered(run, jobs), key=lambda row: row['instance'])
+
+    with open(output, 'w', newline='') as table:
+        writer = csv.DictWriter(table, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+    print('\n%-14s %8s %12s %12s %8s %8s %10s %10s %8s'
+          % ('instance', 'status', 'objective', 'bound', 'gap', 'build', 'solve', 'callback', 'cuts'))
+    for row in results:
+        print('%-14s %8s %12s %12s %8s %8s %10s %10s %8s'
+              % tuple(format_value(row[field]) for field in FIELDS[:9]))
+    return results
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return '%.4g' % value
+    return str(value)
+
+
+def compare(results, baseline_path, objective_tolerance=1e-6, time_tolerance=0.25, min_time=1.0):
+    # A regression is an instance that lost its solution, has a worse
+    # objective, or needs more than (1 + time_tolerance) of the solve time of
+    # the baseline and at least min_time seconds more. Instances missing in
+    # the baseline are only reported.
+    with open(baseline_path, newline='') as table:
+        baseline = {row['instance']: row for row in csv.DictReader(table)}
+
+    regressions = []
+    for row in results:
+        old = baseline.get(row['instance'])
+        if old is None:
+            print('%s: not in the baseline' % row['instance'])
+            continue
+        if old['objective'] != '' and row['objective'] == '':
+            regressions.append('%s: no solution, baseline objective %s' % (row['instance'], old['objective']))
+        elif old['objective'] != '' and row['objective'] > float(old['objective']) + objective_tolerance * max(1, abs(float(old['objective']))):
+            regressions.append('%s: objective %g, baseline %s' % (row['instance'], row['objective'], old['objective']))
+        if old['solve_time'] != '' and row['solve_time'] != '':
+            old_time = float(old['solve_time'])
+            if row['solve_time'] > max((1 + time_tolerance) * old_time, old_time + min_time):
+                regressions.append('%s: solve time %.2f s, baseline %.2f s' % (row['instance'], row['solve_time'], old_time))
+
+    for regression in regressions:
+        print('REGRESSION %s' % regression)
+    if not regressions:
+        print('no regressions against %s' % baseline_path)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Solve a set of .ctt instances in parallel and compare the results to a baseline')
+    parser.add_argument('pattern', nargs='?', default='./comp*.ctt', help='glob of the instance files')
+    parser.add_argument('--workers', type=int, default=None, help='parallel instances, cpu count / threads if not given')
+    parser.add_argument('--threads', type=int, default=1, help='gurobi threads per instance')
+    parser.add_argument('--time-limit', type=float, default=60, help='seconds for the local search, polish and MIP of every instance')
+    parser.add_argument('--output', default='results.csv')
+    parser.add_argument('--baseline', default=None, help='results table of an earlier run to compare to')
+    parser.add_argument('--time-tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = benchmark(args.pattern, args.workers, args.threads, args.time_limit, args.output)
+    if args.baseline is not None and compare(results, args.baseline, time_tolerance=args.time_tolerance):
+        sys.exit(1)
@@ -1,117 +1,58 @@
 from gurobipy import * 
-import pandas as pd 
-import networkx as nx 
-
-def solve(full_path_instance):
+from collections import deque
+from dataclasses import dataclass, field
+from scipy.optimize import linear_sum_assignment
+import numpy as np
+import math
+import random
+import sys
+import time
+
+# c_assistant, c_students, c_days, c_teacher
+PENALTIES = (1, 0.1, 0.1, 10)
+
+def solve(full_path_instance, static_cuts=True, curriculum_cliques=False, method=None, warm_start=True,
+          time_limit=10, polish_window=2, polish_time=10, solve_time=None, threads=None, validate=False, time_budget=None):
+    # method None solves the MIP, started from the local search solution if
+    # warm_start and polished by fix-and-optimize over polish_window
+    # consecutive days at a time (polish_time seconds each, None to skip).
+    # The last solve stops after solve_time seconds and uses threads threads
+    # (gurobi defaults if None). time_budget caps the seconds of the local
+    # search, the polish and the last solve together: the local search gets at
+    # most a fifth, every polish window at most half of what is left divided
+    # by the windows left, the last solve the rest. The model keeps
+    # _build_time, _heuristic_time, _polish_time, _solve_time (seconds of the
+    # phases), _callback_time and _lazy_cuts. The rooms of the solution are assigned afterwards,
+    # model._rooms maps (course, (day, period)) to a room and
+    # model._evaluation holds the penalties the Validator recomputes. With
+    # validate, every incumbent is validated in the callback
+    # (model._incumbents). method 'heuristic' only runs the local search for
+    # time_limit seconds and returns its Schedule.
+    build_start = time.time()
 
     ########## read data ########## 
-    data = open(full_path_instance)
-
-    is_course, is_room, is_curricula, is_unavailability = False, False, False, False  
-
-    index_course, index_room, index_curricula, index_unavailability = 0, 0, 0, 0
-
-    for line in data:
-
-        line = line.split()
-
-        if line == []:
-            continue
-
-        if line[0] == 'Courses:':
-            course = pd.DataFrame(index=list(range(int(line[1]))), columns=['CourseID', 'Teacher', 'Num Lectures', 'MinWorkingDays', 'Num Students'])
-
-        if line[0] == 'Rooms:':
-            room = pd.DataFrame(index=list(range(int(line[1]))), columns=['RoomID', 'Capacity'])
-        
-        if line[0] == 'Days:':
-            days = int(line[1])
+    instance = read_instance(full_path_instance)
 
-        if line[0] == 'Periods_per_day:':
-            periods_per_day = int(line[1])
+    if method == 'heuristic':
+        schedule = local_search(instance, time_limit=time_limit)
+        print('\n objective: %g%s\n' % (schedule.objective, '' if schedule.feasible else ' (not enough rooms)'))
+        return schedule
+    if method is not None:
+        raise ValueError("unknown method %r" % method)
 
-        if line[0] == 'Curricula:':
-            num_curricula = int(line[1])
-            curricula = {}
+    course, room, curricula, unavailability = instance.courses, instance.rooms, instance.curricula, instance.unavailability
+    days, periods_per_day = instance.days, instance.periods_per_day
 
-        if line[0] == 'Constraints:':
-            unavailability = pd.DataFrame(index=list(range(int(line[1]))), columns=['CourseID', 'Day', 'Day_Period'])
-
-        if line[0] == 'COURSES:':
-            is_course = True 
-            continue
-
-        if is_course:
-            course.loc[index_course, 'CourseID'] = line[0]
-            course.loc[index_course, 'Teacher'] = line[1]
-            course.loc[index_course, 'Num Lectures'] = int(line[2])
-            course.loc[index_course, 'MinWorkingDays'] = int(line[3])
-            course.loc[index_course, 'Num Students'] = int(line[4])
-            
-            if index_course == len(course.index) - 1:
-                is_course = False 
-            else:
-                index_course += 1 
-        
-        if line[0] == 'ROOMS:':
-            is_room = True
-            continue
-
-        if is_room:
-            room.loc[index_room, 'RoomID'] = line[0]
-            room.loc[index_room, 'Capacity'] = int(line[1])
-
-            if index_room == len(room.index) - 1:
-                is_room = False
-            else:
-                index_room += 1 
-
-        if line[0] == 'CURRICULA:':
-            is_curricula = True
-            continue
-
-        if is_curricula:
-            curricula[line[0]] = []
-
-            for i in range(2, len(line)):
-                curricula[line[0]].append(line[i])
-
-            if index_curricula == num_curricula - 1:
-                is_curricula = False 
-            else:
-                index_curricula += 1 
-
-        if line[0] == 'UNAVAILABILITY_CONSTRAINTS:':
-            is_unavailability = True 
-            continue
-
-        if is_unavailability:
-            if len(line) < 3:
-                is_unavailability = False
-            else:
-                unavailability.loc[index_unavailability, 'CourseID'] = line[0]
-                unavailability.loc[index_unavailability, 'Day'] = int(line[1])
-                unavailability.loc[index_unavailability, 'Day_Period'] = int(line[2])
-
-                if index_unavailability == len(unavailability.index) - 1:
-                    is_unavailability = False 
-                else:
-                    index_unavailability += 1 
-
-    data.close()
-
-    teacher = {}
-    for index in course.index:
-        if course.loc[index, 'Teacher'] not in teacher.keys():
-            teacher[course.loc[index, 'Teacher']] = []
-        teacher[course.loc[index, 'Teacher']].append(course.loc[index, 'CourseID'])
+    teacher = {t: [] for t in instance.teachers}
+    for k in course:
+        teacher[instance.teachers[k.teacher]].append(k.name)
 
     ########## Penalty ########## 
-    c_assistant, c_students, c_days, c_teacher = 1, 0.1, 0.1, 10
+    c_assistant, c_students, c_days, c_teacher = PENALTIES
 
     ########## Data we have ##########
-    # Dataframe: course, room, unavailability
-    # Dictionary: curricula, teacher
+    # Lists of records: course, room, curricula, unavailability (course ids are positions in course)
+    # Dictionary: teacher
     # Constant: days, periods_per_day
     # Penalties: c_assistant, c_students, c_days, c_teacher 
 
@@ -120,19 +61,19 @@ def solve(full_path_instance):
     
     ########## create variable ########## 
     x = {}
-    for k in course['CourseID']:
+    for k in course:
         for i in range(days):
             for j in range(periods_per_day):
-                x[k,(i,j)] = model.addVar(name="x_%s_(%s,%s)" % (k,i,j), vtype = 'B')
+                x[k.name,(i,j)] = model.addVar(name="x_%s_(%s,%s)" % (k.name,i,j), vtype = 'B')
 
     x_day = {}
-    for k in course['CourseID']:
+    for k in course:
         for i in range(days):
-            x_day[k,i] = model.addVar(name="x_day_%s_%s" % (k,i), vtype = 'B')
+            x_day[k.name,i] = model.addVar(name="x_day_%s_%s" % (k.name,i), vtype = 'B')
 
     z_day = {}
-    for k in course['CourseID']:
-        z_day[k] = model.addVar(name="z_day_%s" % k, vtype = 'I', lb = 0, ub = days)
+    for k in course:
+        z_day[k.name] = model.addVar(name="z_day_%s" % k.name, vtype = 'I', lb = 0, ub = days)
 
     z_assistant = {}
     for t in teacher.keys():
@@ -140,31 +81,28 @@ def solve(full_path_instance):
             for j in range(periods_per_day):
                 z_assistant[t,(i,j)] = model.addVar(name='z_assistant_%s_(%s,%s)' % (t,i,j), vtype = 'I', lb = 0)
 
+    # Courses that share a curriculum, one soft conflict per pair and slot no
+    # matter how many curricula they share, or one slack per curriculum and
+    # slot with curriculum_cliques
+    conflicts = conflict_graph(instance)
     z_students = {}
-    c_k1_k2 = []
-    for index1 in course.index:
-        k1 = course.loc[index1, 'CourseID']
-
-        for index2 in course.index:
-            if index1 >= index2:
-                continue
-
-            k2 = course.loc[index2, 'CourseID']
-
-            for c in curricula:
-                if k1 in curricula[c] and k2 in curricula[c]:
-                    c_k1_k2.append((c,k1,k2))
-
-                    for i in range(days):
-                        for j in range(periods_per_day):
-                            z_students[(c,k1,k2), (i,j)] = model.addVar(name='z_students_(%s,%s,%s)_(%s,%s)' % (c, k1, k2, i, j), vtype = 'B')
+    if curriculum_cliques:
+        students_keys = [c.name for c in curricula]
+        for c in students_keys:
+            for i in range(days):
+                for j in range(periods_per_day):
+                    z_students[c,(i,j)] = model.addVar(name='z_students_%s_(%s,%s)' % (c, i, j), vtype = 'I', lb = 0)
+    else:
+        students_keys = [(course[index1].name, course[index2].name) for index1 in range(len(course)) for index2 in conflicts[index1] if index1 < index2]
+        for (k1,k2) in students_keys:
+            for i in range(days):
+                for j in range(periods_per_day):
+                    z_students[(k1,k2),(i,j)] = model.addVar(name='z_students_(%s,%s)_(%s,%s)' % (k1, k2, i, j), vtype = 'B')
 
     z_teacher = {}
     k_i_j = []
-    for index in unavailability.index:
-        k = unavailability.loc[index, 'CourseID']
-        i = unavailability.loc[index, 'Day']
-        j = unavailability.loc[index, 'Day_Period']
+    for index, i, j in unavailability:
+        k = course[index].name
         k_i_j.append((k,i,j))
         z_teacher[(k,i,j)] = model.addVar(name='z_teacher_(%s,%s,%s)' % (k,i,j), vtype = 'B')
 
@@ -173,102 +111,613 @@ def solve(full_path_instance):
     ########## Objective function ########## 
     model.modelSense = GRB.MINIMIZE
 
-    model.setObjective(c_days * quicksum(z_day[k] for k in course['CourseID'])+ 
+    model.setObjective(c_days * quicksum(z_day[k.name] for k in course)+
                        c_assistant * quicksum(z_assistant[t,(i,j)] for t in teacher.keys() for i in range(days) for j in range(periods_per_day))+
-                       c_students * quicksum(z_students[(c,k1,k2),(i,j)] for (c,k1,k2) in c_k1_k2 for i in range(days) for j in range(periods_per_day))+
+                       c_students * quicksum(z_students[key,(i,j)] for key in students_keys for i in range(days) for j in range(periods_per_day))+
                        c_teacher * quicksum(z_teacher[(k,i,j)] for (k,i,j) in k_i_j))
 
     ########## constraints ########## 
 
     # For every course, a given number of lectures have to be scheduled
-    for index in course.index:
-        k = course.loc[index, 'CourseID']
-        model.addConstr(quicksum(x[k,(i,j)] for i in range(days) for j in range(periods_per_day)) == course.loc[index, 'Num Lectures'])
+    for k in course:
+        model.addConstr(quicksum(x[k.name,(i,j)] for i in range(days) for j in range(periods_per_day)) == k.lectures)
 
     # The lectures of a given course have to take place on at least d_k different days
-    for index in course.index:
-        k = course.loc[index, 'CourseID']
-        model.addConstr(quicksum(x_day[k,i] for i in range(days)) + z_day[k] >= course.loc[index, 'MinWorkingDays'])
+    for k in course:
+        model.addConstr(quicksum(x_day[k.name,i] for i in range(days)) + z_day[k.name] >= k.min_days)
 
     for i in range(days):
-        for k in course['CourseID']:
-            model.addConstr(quicksum(x[k,(i,j)] for j in range(periods_per_day)) >= x_day[k,i])
+        for k in course:
+            model.addConstr(quicksum(x[k.name,(i,j)] for j in range(periods_per_day)) >= x_day[k.name,i])
 
     # Courses taught by the same teacher can not take place in the same time slot
     for t in teacher.keys():
         model.addConstrs(quicksum(x[k,(i,j)] for k in teacher[t]) <= 1 + z_assistant[t,(i,j)] for i in range(days) for j in range(periods_per_day))
 
     # Courses that are part of the same curriculum can not take place in the same time slot
-    for index1 in course.index:
-        k1 = course.loc[index1, 'CourseID']
-
-        for index2 in course.index:
-            if index1 >= index2:
-                continue
-
-            k2 = course.loc[index2, 'CourseID']
-
-            for c in curricula:
-                if k1 in curricula[c] and k2 in curricula[c]:
-                    model.addConstrs(x[k1,(i,j)] + x[k2,(i,j)] <= 1 + z_students[(c,k1,k2),(i,j)] for i in range(days) for j in range(periods_per_day))
-                    break
+    if curriculum_cliques:
+        for c in curricula:
+            model.addConstrs(quicksum(x[course[index].name,(i,j)] for index in c.courses) <= 1 + z_students[c.name,(i,j)] for i in range(days) for j in range(periods_per_day))
+    else:
+        for (k1,k2) in students_keys:
+            model.addConstrs(x[k1,(i,j)] + x[k2,(i,j)] <= 1 + z_students[(k1,k2),(i,j)] for i in range(days) for j in range(periods_per_day))
 
     # For a variety of reasons, some unavailability constraints are given, such that courses k can not take place in some time-slots (i,j)
-    for index in unavailability.index:
-        k = unavailability.loc[index, 'CourseID']
-        i = unavailability.loc[index, 'Day']
-        j = unavailability.loc[index, 'Day_Period']
-        
+    for index, i, j in unavailability:
+        k = course[index].name
+
         model.addConstr(x[k,(i,j)] <= z_teacher[(k,i,j)]) # question why <= instead of == ? 
 
     model.update()
 
     ########## row generation ##########
-    G = nx.DiGraph()
-    G.add_nodes_from(course['CourseID'])
-    G.add_nodes_from(room['RoomID'])
-    G.add_nodes_from(['s', 't'])
-    
-    for k in course['CourseID']:
-        G.add_edge('s', k, capacity=0)
-    
-    for r in room['RoomID']:
-        G.add_edge(r, 't', capacity=1)
-
-    for index_k in course.index:
-        k = course.loc[index_k, 'CourseID']
-        num_students = course.loc[index_k, 'Num Students']
+    # Rooms a course fits in, on integer ids: the courses of a slot need a
+    # matching to distinct rooms
+    course_ids = [k.name for k in course]
+    fits = room_fits(instance)
+
+    # Hall's condition: no set of courses in a slot may fit into fewer rooms
+    # than it has courses. The rooms are the same in every slot, so a cut
+    # holds for all of them.
+    def add_room_cut(add, courses, num_rooms):
+        for i in range(days):
+            for j in range(periods_per_day):
+                add(quicksum(x[course_ids[n],(i,j)] for n in courses) <= num_rooms)
 
-        for index_r in room.index:
-            r = room.loc[index_r, 'RoomID']
-            capacity = room.loc[index_r, 'Capacity']
+    if static_cuts:
+        for courses, num_rooms in hall_cuts(fits):
+            add_room_cut(model.addConstr, courses, num_rooms)
 
-            if num_students <= capacity:
-                G.add_edge(k, r, capacity=1)
+    # the same sets of courses come up again in every incumbent, so the
+    # violators are memoized. The cuts are not: gurobi may propose a solution
+    # that violates an earlier lazy cut again, and lazy cuts are gone in the
+    # next optimize, so every violator of an incumbent is sent.
+    violators = {}
+    found_cuts = {}
+    validator = Validator(instance)
 
     def callback(model, where):
         if where == GRB.Callback.MIPSOL:
+            callback_start = time.time()
             rel = model.cbGetSolution(x)
+            room_cuts = {}
             for i in range(days):
                 for j in range(periods_per_day):
-                    k_1 = []
-                    for k in course['CourseID']:
-                        G.edges[('s',k)]['capacity'] = max(0, rel[k,(i,j)])
-                        if round(rel[k,(i,j)]) == 1:
-                            k_1.append(k)
-                    flow = nx.maximum_flow_value(G, 's', 't')
-                    if len(k_1) > round(flow):
-                        model.cbLazy(quicksum(x[k,(i,j)] for k in k_1) <= flow)
+                    k_1 = frozenset(n for n, k in enumerate(course_ids) if round(rel[k,(i,j)]) == 1)
+                    if k_1 not in violators:
+                        violators[k_1] = hall_violators(k_1, fits, len(room))
+                    room_cuts.update(violators[k_1])
+            found_cuts.update(room_cuts)
+            for courses, num_rooms in room_cuts.items():
+                add_room_cut(model.cbLazy, courses, num_rooms)
+                model._lazy_cuts += days * periods_per_day
+            if validate:
+                model._incumbents.append(validator(slot_matrix(instance, rel)))
+            model._callback_time += time.time() - callback_start
 
     model.params.LazyConstraints = 1
+    if threads is not None:
+        model.params.Threads = threads
+    model._build_time = time.time() - build_start
+    model._callback_time = 0
+    model._lazy_cuts = 0
+    model._incumbents = []
+    model._heuristic_time = 0
+    model._polish_time = 0
+    deadline = None if time_budget is None else time.time() + time_budget
+
+    ########## warm start ##########
+    # no timetable for the local search if a course has more lectures than slots
+    if warm_start and all(k.lectures <= days * periods_per_day for k in course):
+        heuristic_start = time.time()
+        schedule = local_search(instance, time_limit=time_limit if time_budget is None else min(time_limit, time_budget / 5))
+        model._heuristic_time = time.time() - heuristic_start
+        print('local search: objective %g after %d moves' % (schedule.objective, schedule.iterations))
+        if schedule.feasible:
+            incumbent = {(k.name,(i,j)): 0 for k in course for i in range(days) for j in range(periods_per_day)}
+            for index, slots in enumerate(schedule.slots):
+                for s in slots:
+                    incumbent[course[index].name,(s // periods_per_day, s % periods_per_day)] = 1
+            for key in x:
+                x[key].Start = incumbent[key]
+
+            # fix-and-optimize: only the lectures of a window of days may move.
+            # The Hall cuts found in a window become rows of the model, so the
+            # later windows and the final solve do not have to find them again.
+            if polish_window:
+                model.params.TimeLimit = polish_time
+                model_cuts = set()
+                windows = days - polish_window + 1
+                for first in range(windows):
+                    if deadline is not None:
+                        model.params.TimeLimit = max(0, min(polish_time, (deadline - time.time()) / 2 / (windows - first)))
+                    for (k,(i,j)) in x:
+                        if not first <= i < first + polish_window:
+                            x[k,(i,j)].LB = x[k,(i,j)].UB = incumbent[k,(i,j)]
+                    model.optimize(callback)
+                    model._polish_time += model.Runtime
+                    if model.SolCount > 0:
+                        incumbent = {key: round(x[key].X) for key in x}
+                        print('polish days %d-%d: objective %g' % (first, first + polish_window - 1, model.ObjVal))
+                    for courses, num_rooms in found_cuts.items():
+                        if courses not in model_cuts:
+                            model_cuts.add(courses)
+                            add_room_cut(model.addConstr, courses, num_rooms)
+                    for key in x:
+                        x[key].LB, x[key].UB = 0, 1
+                        x[key].Start = incumbent[key]
+                model.params.TimeLimit = GRB.INFINITY
+
+    if solve_time is not None:
+        model.params.TimeLimit = solve_time
+    if deadline is not None:
+        model.params.TimeLimit = max(0, min(model.params.TimeLimit, deadline - time.time()))
     model.optimize(callback)  
+    model._solve_time = model.Runtime
 
     if model.status == GRB.OPTIMAL:
         print('\n objective: %g\n' % model.ObjVal)
     else:
         print('no solution !')
 
+    ########## rooms ##########
+    if model.SolCount > 0:
+        schedule = slot_matrix(instance, {key: x[key].X for key in x})
+        rooms = assign_rooms(instance, schedule)
+        model._rooms = {(k.name,(s // periods_per_day, s % periods_per_day)): room[rooms[index, s]].name
+                        for index, k in enumerate(course) for s in np.flatnonzero(schedule[index]).tolist() if rooms[index, s] >= 0}
+        model._evaluation = validator(schedule, rooms)
+        print('validated: objective %g, %d room changes, %d unused seats%s'
+              % (model._evaluation['objective'], model._evaluation['room_changes'], model._evaluation['unused_seats'],
+                 '' if model._evaluation['feasible'] else ', NOT FEASIBLE'))
+
     return model  
 
+@dataclass
+class Course:
+    __slots__ = ('name', 'teacher', 'lectures', 'min_days', 'students')
+    name: str
+    teacher: int
+    lectures: int
+    min_days: int
+    students: int
+
+
+@dataclass
+class Room:
+    __slots__ = ('name', 'capacity')
+    name: str
+    capacity: int
+
+
+@dataclass
+class Curriculum:
+    __slots__ = ('name', 'courses')
+    name: str
+    courses: list
+
+
+# instance in the ITC2007 .ctt format: a course id is the position of the
+# course in courses, Course.teacher a position in teachers, unavailability
+# lists (course id, day, period)
+@dataclass
+class Instance:
+    name: str = ''
+    days: int = 0
+    periods_per_day: int = 0
+    courses: list = field(default_factory=list)
+    rooms: list = field(default_factory=list)
+    curricula: list = field(default_factory=list)
+    teachers: list = field(default_factory=list)
+    unavailability: list = field(default_factory=list)
+
+
+def read_instance(full_path_instance):
+    # reads a .ctt file in a single pass
+    instance = Instance()
+    course_id, teacher_id = {}, {}
+    section = None
+
+    with open(full_path_instance) as data:
+        for line in data:
+            line = line.split()
+
+            if line == []:
+                continue
+
+            if line[0].endswith(':'):
+                if line[0] == 'Name:':
+                    instance.name = line[1]
+                elif line[0] == 'Days:':
+                    instance.days = int(line[1])
+                elif line[0] == 'Periods_per_day:':
+                    instance.periods_per_day = int(line[1])
+                elif len(line) == 1:
+                    section = line[0]
+                # the counts of the header are given by the sections
+                continue
+
+            if line[0] == 'END.':
+                break
+
+            if section == 'COURSES:':
+                if line[1] not in teacher_id:
+                    teacher_id[line[1]] = len(instance.teachers)
+                    instance.teachers.append(line[1])
+                course_id[line[0]] = len(instance.courses)
+                instance.courses.append(Course(line[0], teacher_id[line[1]], int(line[2]), int(line[3]), int(line[4])))
+            elif section == 'ROOMS:':
+                instance.rooms.append(Room(line[0], int(line[1])))
+            elif section == 'CURRICULA:':
+                instance.curricula.append(Curriculum(line[0], [course_id[k] for k in line[2:]]))
+            elif section == 'UNAVAILABILITY_CONSTRAINTS:':
+                instance.unavailability.append((course_id[line[0]], int(line[1]), int(line[2])))
+            else:
+                raise ValueError("unexpected line in %s: %s" % (full_path_instance, ' '.join(line)))
+
+    return instance
+
+def conflict_graph(instance):
+    # sorted ids of the courses that share a curriculum with every course id
+    curricula_of = [[] for k in instance.courses]
+    for index_c, c in enumerate(instance.curricula):
+        for index in c.courses:
+            curricula_of[index].append(index_c)
+
+    conflicts = []
+    for index, own in enumerate(curricula_of):
+        neighbors = {other for index_c in own for other in instance.curricula[index_c].courses}
+        neighbors.discard(index)
+        conflicts.append(sorted(neighbors))
+    return conflicts
+
+# timetable of local_search: the sorted slots (day*periods_per_day + period)
+# of every course id and its objective in the MIP, without the missing rooms
+# (feasible if there are none)
+@dataclass
+class Schedule:
+    slots: list
+    objective: float
+    feasible: bool
+    iterations: int = 0
+
+
+def room_fits(instance):
+    # ids of the rooms every course fits in
+    return [[index_r for index_r, r in enumerate(instance.rooms) if k.students <= r.capacity] for k in instance.courses]
+
+
+def local_search(instance, time_limit=10, seed=0):
+    # simulated annealing on the slot of every lecture: a Kempe chain, a swap
+    # of two lectures or a move of one, only the touched slots and courses are
+    # recomputed. A course without a room costs room_penalty
+    c_assistant, c_students, c_days, c_teacher = PENALTIES
+    room_penalty = 1000
+    start = time.time()
+    rng = random.Random(seed)
+
+    course = instance.courses
+    periods_per_day = instance.periods_per_day
+    num_slots = instance.days * periods_per_day
+    for k in course:
+        if k.lectures > num_slots:
+            raise ValueError("course %s has %d lectures but there are only %d slots" % (k.name, k.lectures, num_slots))
+    fits = room_fits(instance)
+    conflicts = [set(neighbors) for neighbors in conflict_graph(instance)]
+    unavailable = {(index, i*periods_per_day + j) for index, i, j in instance.unavailability}
+    teacher_courses = [set() for t in instance.teachers]
+    for index, k in enumerate(course):
+        teacher_courses[k.teacher].add(index)
+    linked = [(conflicts[index] | teacher_courses[k.teacher]) - {index} for index, k in enumerate(course)]
+
+    lecture_course = [index for index, k in enumerate(course) for n in range(k.lectures)]
+    slot_of = [-1] * len(lecture_course)
+    in_slot = [{} for s in range(num_slots)]
+    course_slots = [set() for k in course]
+    matching = {}
+
+    def slot_cost(s):
+        courses = in_slot[s]
+        teachers = {}
+        pairs = 0
+        for index in courses:
+            teachers[course[index].teacher] = teachers.get(course[index].teacher, 0) + 1
+            pairs += sum(1 for other in conflicts[index] if other in courses)
+        key = frozenset(courses)
+        if key not in matching:
+            matching[key] = max_matching(key, fits, len(instance.rooms))[0]
+        return (c_assistant * sum(n - 1 for n in teachers.values())
+                + c_students * pairs / 2
+                + room_penalty * (len(key) - matching[key]))
+
+    def course_cost(index):
+        days = {s // periods_per_day for s in course_slots[index]}
+        return (c_days * max(0, course[index].min_days - len(days))
+                + c_teacher * sum(1 for s in course_slots[index] if (index, s) in unavailable))
+
+    def place(lecture, s):
+        index = lecture_course[lecture]
+        if slot_of[lecture] >= 0:
+            del in_slot[slot_of[lecture]][index]
+            course_slots[index].discard(slot_of[lecture])
+        slot_of[lecture] = s
+        if s >= 0:
+            in_slot[s][index] = lecture
+            course_slots[index].add(s)
+
+    def apply(moves):
+        # returns the change of the cost and the moves that undo it, None if
+        # a course would take place twice in a slot
+        touched = {slot_of[lecture] for lecture, s in moves} | {s for lecture, s in moves}
+        touched.discard(-1)
+        courses = {lecture_course[lecture] for lecture, s in moves}
+        before = sum(slot_cost(s) for s in touched) + sum(course_cost(index) for index in courses)
+        undo = [(lecture, slot_of[lecture]) for lecture, s in moves]
+        for lecture, s in moves:
+            place(lecture, -1)
+        for lecture, s in moves:
+            if lecture_course[lecture] in in_slot[s]:
+                revert(undo)
+                return None
+            place(lecture, s)
+        after = sum(slot_cost(s) for s in touched) + sum(course_cost(index) for index in courses)
+        return after - before, undo
+
+    def revert(undo):
+        for lecture, s in undo:
+            place(lecture, -1)
+        for lecture, s in undo:
+            place(lecture, s)
+
+    def kempe_chain(lecture, s1, s2):
+        chain = {lecture}
+        queue = [lecture]
+        while queue:
+            m = queue.pop()
+            other = s2 if slot_of[m] == s1 else s1
+            index = lecture_course[m]
+            for index2, m2 in in_slot[other].items():
+                if m2 not in chain and (index2 == index or index2 in linked[index]):
+                    chain.add(m2)
+                    queue.append(m2)
+        return [(m, s2 if slot_of[m] == s1 else s1) for m in chain]
+
+    # greedy start: lectures of the courses with the fewest rooms and the most
+    # conflicts first, each into its cheapest slot
+    order = sorted(range(len(lecture_course)), key=lambda lecture: (len(fits[lecture_course[lecture]]), -len(linked[lecture_course[lecture]])))
+    for lecture in order:
+        best_slot, best_delta = None, None
+        for s in rng.sample(range(num_slots), num_slots):
+            result = apply([(lecture, s)])
+            if result is None:
+                continue
+            delta, undo = result
+            revert(undo)
+            if best_delta is None or delta < best_delta:
+                best_slot, best_delta = s, delta
+        place(lecture, best_slot)
+
+    current = sum(slot_cost(s) for s in range(num_slots)) + sum(course_cost(index) for index in range(len(course)))
+    best, best_slot_of = current, slot_of[:]
+
+    # temperature from t_start down to t_end over the time budget. The
+    # lectures of the courses that only fit in the rooms of a set beyond
+    # num_slots per room of the set never get a room, a timetable that only
+    # misses these can not be improved
+    lowest = room_penalty * max([0] + [sum(k.lectures for index, k in enumerate(course) if rooms.issuperset(fits[index])) - num_slots * len(rooms)
+                                       for rooms in map(frozenset, fits)])
+    t_start, t_end = 1.0, 0.01
+    iterations = 0
+    while best > lowest + 1e-9 and time.time() - start < time_limit:
+        iterations += 1
+        temperature = t_start * (t_end / t_start) ** ((time.time() - start) / time_limit)
+        lecture = rng.randrange(len(slot_of))
+        s1, s2 = slot_of[lecture], rng.randrange(num_slots)
+        if s1 == s2:
+            continue
+
+        r = rng.random()
+        if r < 0.4:
+            moves = kempe_chain(lecture, s1, s2)
+        elif r < 0.7 and in_slot[s2]:
+            moves = [(lecture, s2), (rng.choice(list(in_slot[s2].values())), s1)]
+        else:
+            moves = [(lecture, s2)]
+
+        result = apply(moves)
+        if result is None:
+            continue
+        delta, undo = result
+        if delta <= 1e-9 or rng.random() < math.exp(-delta / temperature):
+            current += delta
+            if current < best - 1e-9:
+                best, best_slot_of = current, slot_of[:]
+        else:
+            revert(undo)
+
+    # the best timetable, its cost from scratch
+    for lecture in range(len(slot_of)):
+        place(lecture, -1)
+    for lecture, s in enumerate(best_slot_of):
+        place(lecture, s)
+    objective = sum(slot_cost(s) for s in range(num_slots)) + sum(course_cost(index) for index in range(len(course)))
+    missing = sum(len(in_slot[s]) - matching[frozenset(in_slot[s])] for s in range(num_slots))
+    return Schedule([sorted(own) for own in course_slots], objective - room_penalty * missing, missing == 0, iterations)
+
+def slot_matrix(instance, x):
+    # 0/1 array course id x slot (day*periods_per_day + period) of a solution
+    return np.array([[round(x[k.name,(i,j)]) for i in range(instance.days) for j in range(instance.periods_per_day)]
+                     for k in instance.courses], dtype=np.int64)
+
+
+def assign_rooms(instance, schedule, rounds=3):
+    # room id of every course id x slot (-1 if none), a minimum cost assignment
+    # in every slot: unused seats, room changes from the last round first
+    capacity = np.array([r.capacity for r in instance.rooms])
+    students = np.array([k.students for k in instance.courses])
+    unused = capacity[None,:] - students[:,None]
+    change = capacity.max() + 1
+    impossible = change * (len(instance.rooms) + 1) * 2
+
+    rooms = np.full(schedule.shape, -1)
+    preferred = np.full(len(instance.courses), -1)
+    for n in range(rounds):
+        for s in range(schedule.shape[1]):
+            courses = np.flatnonzero(schedule[:,s])
+            rooms[:,s] = -1
+            if len(courses) == 0:
+                continue
+            cost = np.where(unused[courses] >= 0, unused[courses], impossible)
+            cost = cost + change * ((preferred[courses,None] >= 0) & (np.arange(len(capacity))[None,:] != preferred[courses,None]))
+            rows, cols = linear_sum_assignment(cost)
+            fits = unused[courses[rows], cols] >= 0
+            rooms[courses[rows[fits]], s] = cols[fits]
+
+        for index in range(len(preferred)):
+            used = rooms[index][rooms[index] >= 0]
+            if len(used):
+                preferred[index] = np.bincount(used).argmax()
+    return rooms
+
+
+# recomputes the penalties and the violated hard constraints of a 0/1 array
+# course id x slot (and its rooms) from scratch
+class Validator:
+
+    def __init__(self, instance):
+        courses = instance.courses
+        self.days, self.periods_per_day = instance.days, instance.periods_per_day
+        num_slots = self.days * self.periods_per_day
+        self.lectures = np.array([k.lectures for k in courses])
+        self.min_days = np.array([k.min_days for k in courses])
+        self.students = np.array([k.students for k in courses])
+        self.capacity = np.array([r.capacity for r in instance.rooms])
+
+        self.teacher = np.zeros((len(instance.teachers), len(courses)), dtype=np.int64)
+        self.teacher[[k.teacher for k in courses], np.arange(len(courses))] = 1
+
+        # every conflicting pair once
+        self.conflicts = np.zeros((len(courses), len(courses)), dtype=np.int64)
+        for index, neighbors in enumerate(conflict_graph(instance)):
+            for other in neighbors:
+                if index < other:
+                    self.conflicts[index, other] = 1
+
+        self.unavailable = np.zeros((len(courses), num_slots), dtype=np.int64)
+        for index, i, j in instance.unavailability:
+            self.unavailable[index, i*self.periods_per_day + j] = 1
+
+    def __call__(self, schedule, rooms=None):
+        c_assistant, c_students, c_days, c_teacher = PENALTIES
+        schedule = np.asarray(schedule, dtype=np.int64)
+
+        result = {
+            'assistant': int(np.maximum(self.teacher @ schedule - 1, 0).sum()),
+            'students': int(((self.conflicts @ schedule) * schedule).sum()),
+            'days': int(np.maximum(self.min_days - schedule.reshape(len(self.lectures), self.days, self.periods_per_day).any(axis=2).sum(axis=1), 0).sum()),
+            'teacher': int((schedule * self.unavailable).sum()),
+            'lectures': int(np.abs(schedule.sum(axis=1) - self.lectures).sum() + (schedule > 1).sum()),
+        }
+        result['objective'] = (c_assistant * result['assistant'] + c_students * result['students']
+                               + c_days * result['days'] + c_teacher * result['teacher'])
+
+        if rooms is not None:
+            scheduled = schedule > 0
+            placed = scheduled & (rooms >= 0)
+            course_ids, slots = np.nonzero(placed)
+            room_ids = rooms[placed]
+            occupancy = np.zeros((len(self.capacity), schedule.shape[1]), dtype=np.int64)
+            np.add.at(occupancy, (room_ids, slots), 1)
+            used = np.zeros((len(self.lectures), len(self.capacity)), dtype=bool)
+            used[course_ids, room_ids] = True
+
+            result['rooms_missing'] = int((scheduled & (rooms < 0)).sum())
+            result['room_conflicts'] = int(np.maximum(occupancy - 1, 0).sum())
+            result['capacity'] = int((self.students[course_ids] > self.capacity[room_ids]).sum())
+            result['room_changes'] = int(np.maximum(used.sum(axis=1) - 1, 0).sum())
+            result['unused_seats'] = int(np.maximum(self.capacity[room_ids] - self.students[course_ids], 0).sum())
+
+        result['feasible'] = all(result.get(key, 0) == 0 for key in ('lectures', 'rooms_missing', 'room_conflicts', 'capacity'))
+        return result
+
+def max_matching(left, adjacency, num_right):
+    # Hopcroft-Karp, returns the size and the right vertex of every left vertex (-1 if unmatched)
+    left = list(left)
+    match_left = {u: -1 for u in left}
+    match_right = [-1] * num_right
+
+    def augment(u):
+        for v in adjacency[u]:
+            w = match_right[v]
+            if w == -1 or (layer.get(w) == layer[u] + 1 and augment(w)):
+                match_left[u] = v
+                match_right[v] = u
+                return True
+        layer[u] = None
+        return False
+
+    size = 0
+    while True:
+        # layers of the alternating paths from the free left vertices
+        layer = {u: 0 for u in left if match_left[u] == -1}
+        queue = deque(layer)
+        free_right = False
+        while queue:
+            u = queue.popleft()
+            for v in adjacency[u]:
+                w = match_right[v]
+                if w == -1:
+                    free_right = True
+                elif w not in layer:
+                    layer[w] = layer[u] + 1
+                    queue.append(w)
+        if not free_right:
+            return size, match_left
+
+        # augment along vertex disjoint shortest paths
+        for u in left:
+            if match_left[u] == -1 and augment(u):
+                size += 1
+
+def hall_violators(left, adjacency, num_right):
+    # (set of left vertices, number of their neighbors) with one neighbor less
+    # than vertices: a free vertex of a maximum matching and the left vertices
+    # on its alternating paths
+    size, match_left = max_matching(left, adjacency, num_right)
+    match_right = [-1] * num_right
+    for u, v in match_left.items():
+        if v != -1:
+            match_right[v] = u
+
+    violators = {}
+    for u in match_left:
+        if match_left[u] != -1:
+            continue
+        # every neighbor of the set is matched, else there was an augmenting path
+        seen = {u}
+        neighbors = set()
+        queue = deque([u])
+        while queue:
+            w = queue.popleft()
+            for v in adjacency[w]:
+                neighbors.add(v)
+                if match_right[v] not in seen:
+                    seen.add(match_right[v])
+                    queue.append(match_right[v])
+        violators[frozenset(seen)] = len(neighbors)
+    return list(violators.items())
+
+
+def hall_cuts(adjacency):
+    # static room cuts (left vertices, number of neighbors): the vertices whose
+    # neighbors are all in a neighborhood N are at most |N| in a matching
+    cuts = {}
+    for rooms in map(frozenset, adjacency):
+        if rooms in cuts:
+            continue
+        courses = [w for w, other in enumerate(adjacency) if rooms.issuperset(other)]
+        cuts[rooms] = courses
+    return [(courses, len(rooms)) for rooms, courses in cuts.items() if len(courses) > len(rooms)]
+
 if __name__ == "__main__":
-    solve(full_path_instance = r'E:\OR_Coding\POM\university timetabling\comp02.ctt')
\ No newline at end of file
+    solve(full_path_instance = sys.argv[1] if len(sys.argv) > 1 else './comp02.ctt')
\ No newline at end of file